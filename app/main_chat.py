@@ -11,6 +11,10 @@ from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from app.routes.chat_routes import router as chat_router
 from app.routes.status_routes import router as status_router
+from app.routes.logs_routes import router as logs_router
+from app.services.aggregates import agregados
+from app.services.collection_registry import registro_colecoes
+from app.services.session_store import sessoes
 import os
 
 # ==============================================================
@@ -47,6 +51,20 @@ app.mount("/web", StaticFiles(directory=WEB_DIR), name="web")
 # ==============================================================
 app.include_router(chat_router)
 app.include_router(status_router)
+app.include_router(logs_router)
+
+# ==============================================================
+# 🗂️ Descoberta das coleções de logs e agregados (inicial + periódica)
+# ==============================================================
+@app.on_event("startup")
+async def iniciar_registro_colecoes():
+    registro_colecoes.iniciar_descoberta_periodica()
+    agregados.iniciar_sincronizacao_periodica(registro_colecoes.nomes)
+
+    # Sessões só locais: um acompanhamento atendido por outro worker não as encontra
+    if sessoes.l2 is None and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        print("⚠️ [Sessões] WEB_CONCURRENCY > 1 sem L2 compartilhado (CACHE_REDIS_URL): "
+              "perguntas de acompanhamento podem perder o contexto da sessão.")
 
 # ==============================================================
 # 🏠 Página inicial - abre interface web
@@ -8,11 +8,18 @@
 
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
+from typing import Optional
 from datetime import datetime
 from app.utils.validation import is_prompt_valid
 from app.services.openai_client import gerar_resposta
+from app.services.retrieval_strategies import ESTRATEGIAS
+from app.services.session_store import sessoes
+from app.utils.deadline import Deadline
+from app.utils.profiling import modo_profiling, perfilar
+from contextlib import nullcontext
 import json
 import hashlib
+import uuid
 
 router = APIRouter(tags=["Chat Assistente"])
 
@@ -21,6 +28,8 @@ router = APIRouter(tags=["Chat Assistente"])
 # ==============================================================
 class ChatRequest(BaseModel):
     pergunta: str
+    session_id: Optional[str] = None
+    estrategia: Optional[str] = None  # recencia | lexica | semantica | hibrida
 
 # ==============================================================
 # 📤 Modelo de saída (Swagger e compatibilidade)
@@ -30,11 +39,19 @@ class ChatResponse(BaseModel):
     resposta: str
     timestamp: str
     status: str
+    session_id: Optional[str] = None
+    modo_degradacao: Optional[str] = None
+    perfil: Optional[dict] = None
 
 # ==============================================================
-# 🧠 Função auxiliar - log estruturado para Fluent Bit
+# 🧠 Funções auxiliares - log estruturado para Fluent Bit
 # ==============================================================
-def log_event(pergunta: str, resposta: str, status: str, erro: str = None):
+def calcular_hash_execucao(pergunta: str) -> str:
+    """Identificador curto da execução (correlaciona logs e artefatos de profiling)."""
+    return hashlib.sha256(pergunta.encode()).hexdigest()[:12]
+
+
+def log_event(pergunta: str, resposta: str, status: str, erro: str = None, modo: str = None):
     evento = {
         "service": "assistente-logs-chat",
         "timestamp": datetime.utcnow().isoformat() + "Z",
@@ -42,12 +59,15 @@ def log_event(pergunta: str, resposta: str, status: str, erro: str = None):
         "mensagem_curta": f"Chat executado com status {status}",
         "pergunta": pergunta,
         "resposta_tamanho": len(resposta) if resposta else 0,
-        "hash_execucao": hashlib.sha256(pergunta.encode()).hexdigest()[:12],
+        "hash_execucao": calcular_hash_execucao(pergunta),
     }
 
     if erro:
         evento["erro"] = str(erro)
 
+    if modo:
+        evento["modo_degradacao"] = modo
+
     print(json.dumps(evento, ensure_ascii=False))
 
 
@@ -62,29 +82,46 @@ async def chat_endpoint(request: Request, body: ChatRequest):
     Aceita POST /chat e /chat/ para compatibilidade com front-end e Postman.
     """
     pergunta = body.pergunta.strip()
+    session_id = body.session_id or uuid.uuid4().hex
 
-    # 🔍 Validação semântica da pergunta
-    if not is_prompt_valid(pergunta):
+    # 🔍 Validação semântica da pergunta (acompanhamentos de uma sessão ativa dispensam os termos técnicos)
+    if not is_prompt_valid(pergunta, acompanhamento=sessoes.possui_contexto(session_id)):
         log_event(pergunta, "", "blocked", "Pergunta fora de contexto técnico")
         raise HTTPException(
             status_code=400,
             detail="❌ Pergunta fora do contexto técnico. O assistente responde apenas sobre sistemas, logs e sustentação."
         )
 
+    if body.estrategia and body.estrategia not in ESTRATEGIAS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"❌ Estratégia de recuperação inválida. Use uma de: {', '.join(ESTRATEGIAS)}."
+        )
+
+    # 🔬 Profiling sob demanda (header X-Profile + X-Admin-Token)
+    modo_perfil = modo_profiling(request)
+    deadline = Deadline()
+
     try:
         print(f"💬 Pergunta recebida: {pergunta}")
-        resposta = gerar_resposta(pergunta)
-        log_event(pergunta, resposta, "success")
+        profiling = perfilar(modo_perfil, calcular_hash_execucao(pergunta)) if modo_perfil else nullcontext()
+        with profiling as perfil:
+            resposta = gerar_resposta(pergunta, session_id=session_id, deadline=deadline,
+                                      estrategia=body.estrategia)
+        log_event(pergunta, resposta, "success", modo=deadline.modo)
 
         return {
             "pergunta": pergunta,
             "resposta": resposta,
             "timestamp": datetime.utcnow().isoformat() + "Z",
             "status": "success",
+            "session_id": session_id,
+            "modo_degradacao": deadline.modo,
+            "perfil": perfil,
         }
 
     except Exception as e:
-        log_event(pergunta, "", "error", str(e))
+        log_event(pergunta, "", "error", str(e), modo=deadline.modo)
         print(f"❌ Erro ao gerar resposta: {e}")
         raise HTTPException(status_code=500, detail="Erro interno ao gerar resposta.")
 
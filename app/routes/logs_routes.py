@@ -0,0 +1,376 @@
+# ==============================================================
+# 🔎 app/routes/logs_routes.py
+# --------------------------------------------------------------
+# Busca de logs para SREs: expõe a evidência bruta (sanitizada)
+# por trás das respostas do assistente.
+# Os registros são transmitidos em NDJSON, lidos do Firestore
+# com paginação por cursor e processados em um pipeline de
+# geradores — a memória fica constante, não importa quantos
+# registros correspondam à busca.
+# A ingestão (POST /logs/ingest) recebe lotes NDJSON e grava os
+# logs já sanitizados e com embedding, prontos para ranquear.
+# ==============================================================
+
+import os
+import re
+import hmac
+import json
+import base64
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from firebase_admin import firestore
+from app.services.aggregates import converter_timestamp, normalizar_nivel
+from app.services.collection_registry import registro_colecoes
+from app.services.embedding_backends import obter_backend
+from app.services.firestore_client import get_firestore_client
+from app.services.firestore_context import (
+    LIMITE_TEXTO_EMBEDDING,
+    extrair_texto_log,
+    normalizar_termos,
+    pontuar,
+)
+
+try:
+    from google.cloud.firestore_v1.vector import Vector  # vetor nativo (não indexado por elemento)
+except ImportError:
+    Vector = list
+
+router = APIRouter(prefix="/logs", tags=["Logs"])
+
+TAMANHO_PAGINA = 100
+LIMITE_MAXIMO = 1000
+VARREDURA_MAXIMA = 5000
+
+BUSCA_TOKEN = os.getenv("LOGS_BUSCA_TOKEN")  # sem token → busca desativada
+INGESTAO_TOKEN = os.getenv("LOGS_INGESTAO_TOKEN")  # sem token → ingestão desativada
+LIMITE_LINHAS_INGESTAO = int(os.getenv("LOGS_INGESTAO_MAX_LINHAS", "10000"))
+LIMITE_BYTES_LINHA = 64 * 1024
+TAMANHO_LOTE_ESCRITA = 500  # limite de operações por batch do Firestore
+TIMEOUT_EMBEDDINGS_LOTE = 30
+MAX_ERROS_REPORTADOS = 20
+_RE_NOME_COLECAO = re.compile(r"^[a-z0-9_]+$")
+
+# ==============================================================
+# 🔧 Funções auxiliares
+# ==============================================================
+
+def codificar_token(colecoes: list, indice: int, ultimo_doc: str,
+                    q: Optional[str], nivel: Optional[str], limite: int) -> str:
+    """Posição do cursor e filtros da busca (a próxima página herda os mesmos filtros)."""
+    dados = json.dumps({"c": colecoes, "i": indice, "d": ultimo_doc, "q": q, "l": nivel, "n": limite},
+                       separators=(",", ":"))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip("=")
+
+
+def decodificar_token(token: str) -> dict:
+    try:
+        preenchido = token + "=" * (-len(token) % 4)
+        dados = json.loads(base64.urlsafe_b64decode(preenchido.encode()))
+        if (not isinstance(dados.get("c"), list) or not isinstance(dados.get("i"), int)
+                or not 0 <= dados["i"] < len(dados["c"])
+                or not isinstance(dados.get("n"), int) or not 1 <= dados["n"] <= LIMITE_MAXIMO
+                or any(dados.get(campo) is not None and not isinstance(dados[campo], str)
+                       for campo in ("q", "l", "d"))):
+            raise ValueError("estrutura inválida")
+        return dados
+    except Exception:
+        raise HTTPException(status_code=400, detail="❌ Token de continuação inválido.")
+
+
+def verificar_token_busca(request: Request):
+    token = request.headers.get("X-Logs-Token", "")
+    if not BUSCA_TOKEN or not hmac.compare_digest(token, BUSCA_TOKEN):
+        raise HTTPException(status_code=403, detail="❌ Busca de logs não autorizada.")
+
+
+def validar_colecoes(colecoes: list) -> list:
+    """Aceita apenas coleções de logs registradas (nunca coleções arbitrárias do Firestore)."""
+    registradas = set(registro_colecoes.nomes())
+    if not colecoes or any(not isinstance(c, str) or c not in registradas for c in colecoes):
+        raise HTTPException(status_code=400, detail="❌ Coleção de logs inválida ou não registrada.")
+    return colecoes
+
+
+def serializar_timestamp(valor):
+    if valor is None:
+        return None
+    return valor.isoformat() if hasattr(valor, "isoformat") else str(valor)
+
+
+# ==============================================================
+# 🔁 Pipeline de geradores
+# ==============================================================
+
+def paginar_colecao(db, colecao: str, apos_doc: str = None, tamanho_pagina: int = TAMANHO_PAGINA):
+    """Percorre a coleção (mais recentes primeiro) página a página via cursor."""
+    cursor = None
+    if apos_doc:
+        cursor = db.collection(colecao).document(apos_doc).get()
+        if not cursor.exists:
+            cursor = None
+
+    while True:
+        query = (
+            db.collection(colecao)
+            .order_by("timestamp", direction=firestore.Query.DESCENDING)
+            .limit(tamanho_pagina)
+        )
+        if cursor is not None:
+            query = query.start_after(cursor)
+
+        lidos = 0
+        for doc in query.stream():
+            lidos += 1
+            cursor = doc
+            yield doc
+
+        if lidos < tamanho_pagina:
+            return
+
+
+def buscar_registros(colecoes: list, indice_inicial: int, apos_doc: str,
+                     q: Optional[str], nivel: Optional[str], limite: int):
+    """
+    Gera linhas NDJSON dos registros correspondentes e, ao final,
+    uma linha com o token de continuação (null quando não há mais dados).
+    """
+    db = get_firestore_client()
+    termos_busca = set(normalizar_termos(q))
+    emitidos = 0
+    varridos = 0
+
+    for indice in range(indice_inicial, len(colecoes)):
+        colecao = colecoes[indice]
+        ultimo_doc = apos_doc if indice == indice_inicial else None
+
+        for doc in paginar_colecao(db, colecao, ultimo_doc):
+            ultimo_doc = doc.id
+            varridos += 1
+            data = doc.to_dict()
+
+            if not nivel or normalizar_nivel(data) == nivel:
+                texto = extrair_texto_log(data)
+                score = pontuar(termos_busca, texto)
+                if texto and score > 0:
+                    emitidos += 1
+                    yield json.dumps({
+                        "colecao": colecao,
+                        "doc_id": doc.id,
+                        "score": round(score, 3),
+                        "timestamp": serializar_timestamp(data.get("timestamp")),
+                        "level": normalizar_nivel(data),
+                        "texto": texto,
+                    }, ensure_ascii=False) + "\n"
+
+            # Limite de registros ou de varredura atingido → devolve o cursor
+            if emitidos >= limite or varridos >= VARREDURA_MAXIMA:
+                token = codificar_token(colecoes, indice, ultimo_doc, q, nivel, limite)
+                yield json.dumps({"continuation_token": token, "emitidos": emitidos,
+                                  "varridos": varridos}) + "\n"
+                return
+
+    yield json.dumps({"continuation_token": None, "emitidos": emitidos, "varridos": varridos}) + "\n"
+
+
+# ==============================================================
+# 🚀 Endpoint
+# ==============================================================
+
+@router.get("/search")
+def search_logs(
+    request: Request,
+    q: Optional[str] = Query(None, description="Texto da busca (termos sem acento/caixa)"),
+    colecao: Optional[str] = Query(None, description="Coleção específica (padrão: todas)"),
+    level: Optional[str] = Query(None, description="Nível do log (ex.: ERROR, WARN, INFO)"),
+    limite: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO, description="Registros por página (padrão: 100)"),
+    token: Optional[str] = Query(None, description="Token de continuação da página anterior"),
+):
+    """
+    Transmite em NDJSON os logs sanitizados que correspondem à busca,
+    com coleção, score e timestamp. A última linha traz o
+    `continuation_token` para buscar a próxima página; o token guarda
+    os filtros (q, level, limite), basta enviá-lo sozinho.
+    Requer o header X-Logs-Token.
+    """
+    verificar_token_busca(request)
+    nivel = level.strip().upper() if level else None
+
+    if token:
+        posicao = decodificar_token(token)
+        colecoes, indice, apos_doc = posicao["c"], posicao["i"], posicao.get("d")
+        divergentes = (
+            (q is not None and q != posicao.get("q"))
+            or (nivel is not None and nivel != posicao.get("l"))
+            or (limite is not None and limite != posicao["n"])
+            or (colecao is not None and [colecao] != colecoes)
+        )
+        if divergentes:
+            raise HTTPException(status_code=400,
+                                detail="❌ Filtros diferentes dos registrados no token de continuação.")
+        q, nivel, limite = posicao.get("q"), posicao.get("l"), posicao["n"]
+    else:
+        colecoes = [colecao] if colecao else registro_colecoes.nomes()
+        indice, apos_doc = 0, None
+        limite = limite or 100
+    validar_colecoes(colecoes)
+
+    print(f"🔎 [Logs] Busca: q={q!r} colecoes={colecoes} level={nivel} limite={limite}")
+
+    return StreamingResponse(
+        buscar_registros(colecoes, indice, apos_doc, q, nivel, limite),
+        media_type="application/x-ndjson",
+    )
+
+
+# ==============================================================
+# 📥 Ingestão em lote
+# ==============================================================
+
+def verificar_token_ingestao(request: Request):
+    token = request.headers.get("X-Ingest-Token", "")
+    if not INGESTAO_TOKEN or not hmac.compare_digest(token, INGESTAO_TOKEN):
+        raise HTTPException(status_code=403, detail="❌ Ingestão de logs não autorizada.")
+
+
+def interpretar_linha(linha: bytes, colecao_padrao: Optional[str]):
+    """
+    Valida uma linha NDJSON e retorna (colecao, doc_id, data).
+    Campos de controle `colecao` e `doc_id` não são gravados no documento.
+    """
+    if len(linha) > LIMITE_BYTES_LINHA:
+        raise ValueError("linha acima do tamanho máximo")
+    data = json.loads(linha)
+    if not isinstance(data, dict):
+        raise ValueError("a linha deve ser um objeto JSON")
+
+    colecao = data.pop("colecao", None) or colecao_padrao
+    if not colecao or not _RE_NOME_COLECAO.match(colecao) or not colecao.endswith(registro_colecoes.sufixo):
+        raise ValueError(f"coleção inválida: {colecao!r} (use o sufixo '{registro_colecoes.sufixo}')")
+
+    doc_id = data.pop("doc_id", None)
+    if doc_id is not None and (not isinstance(doc_id, str) or not doc_id or "/" in doc_id):
+        raise ValueError("doc_id inválido")
+
+    for campo in ("texto_normalizado", "embedding", "embedding_backend"):
+        data.pop(campo, None)  # calculados aqui, nunca aceitos do cliente
+
+    # Timestamp nativo: strings ordenam depois de Timestamps no Firestore e
+    # nunca satisfazem filtros `timestamp > desde` das leituras incrementais
+    if data.get("timestamp") is None:
+        data["timestamp"] = datetime.now(timezone.utc)
+    else:
+        timestamp = converter_timestamp(data["timestamp"])
+        if timestamp is None:
+            raise ValueError(f"timestamp inválido: {data['timestamp']!r}")
+        data["timestamp"] = timestamp
+    return colecao, doc_id, data
+
+
+def gravar_lote(registros: list) -> dict:
+    """
+    Sanitiza uma vez, gera os embeddings em lote e grava em um único
+    batch do Firestore (até TAMANHO_LOTE_ESCRITA documentos).
+    """
+    db = get_firestore_client()
+    backend = obter_backend()
+
+    textos = [extrair_texto_log(data) for _, _, data in registros]
+    embeddings = backend.gerar_lote([t[:LIMITE_TEXTO_EMBEDDING] for t in textos],
+                                    timeout=TIMEOUT_EMBEDDINGS_LOTE)
+
+    batch = db.batch()
+    gravados = []
+    for (colecao, doc_id, data), texto, embedding in zip(registros, textos, embeddings):
+        documento = dict(data, texto_normalizado=texto)
+        if len(embedding):
+            documento["embedding"] = Vector([float(v) for v in embedding])
+            documento["embedding_backend"] = backend.nome
+        ref = db.collection(colecao).document(doc_id) if doc_id else db.collection(colecao).document()
+        batch.set(ref, documento)
+        gravados.append((colecao, ref.id, data))
+    batch.commit()
+
+    # Frescor das coleções acompanha a escrita (os indicadores vêm da sincronização periódica)
+    for colecao, doc_id, data in gravados:
+        registro_colecoes.observar(colecao, data.get("timestamp"))
+
+    return {"gravados": len(gravados), "com_embedding": sum(1 for e in embeddings if len(e))}
+
+
+@router.post("/ingest")
+async def ingest_logs(
+    request: Request,
+    colecao: Optional[str] = Query(None, description="Coleção padrão das linhas sem campo `colecao`"),
+):
+    """
+    Recebe logs em NDJSON (um objeto JSON por linha) e os grava no Firestore
+    com `texto_normalizado` (sanitizado), `embedding` e `embedding_backend`.
+    Requer o header X-Ingest-Token. Linhas inválidas são rejeitadas
+    individualmente; as demais são gravadas em batches de até 500.
+    """
+    verificar_token_ingestao(request)
+
+    resumo = {"recebidos": 0, "gravados": 0, "com_embedding": 0, "rejeitados": 0, "lotes": 0, "erros": []}
+    lote = []
+
+    async def descarregar():
+        parcial = await run_in_threadpool(gravar_lote, lote)
+        resumo["gravados"] += parcial["gravados"]
+        resumo["com_embedding"] += parcial["com_embedding"]
+        resumo["lotes"] += 1
+        lote.clear()
+
+    def rejeitar(numero: int, erro: str):
+        resumo["rejeitados"] += 1
+        if len(resumo["erros"]) < MAX_ERROS_REPORTADOS:
+            resumo["erros"].append({"linha": numero, "erro": erro})
+
+    async def linhas():
+        pendente = b""
+        descartando = False  # resto de uma linha longa demais: ignora até o próximo \n
+        async for bloco in request.stream():
+            if descartando:
+                fim = bloco.find(b"\n")
+                if fim < 0:
+                    continue
+                bloco = bloco[fim + 1:]
+                descartando = False
+            pendente += bloco
+            *completas, pendente = pendente.split(b"\n")
+            for linha in completas:
+                yield linha
+            if len(pendente) > LIMITE_BYTES_LINHA:
+                yield pendente  # rejeitada pelo tamanho (uma única vez)
+                pendente = b""
+                descartando = True
+        if not descartando:
+            yield pendente
+
+    numero = 0
+    async for linha in linhas():
+        if not linha.strip():
+            continue
+        numero += 1
+        if numero > LIMITE_LINHAS_INGESTAO:
+            raise HTTPException(status_code=413, detail=(
+                f"❌ Lote acima de {LIMITE_LINHAS_INGESTAO} linhas; "
+                f"{resumo['gravados']} registros já foram gravados."
+            ))
+        resumo["recebidos"] += 1
+        try:
+            lote.append(interpretar_linha(linha, colecao))
+        except ValueError as e:  # inclui JSON inválido
+            rejeitar(numero, str(e))
+            continue
+        if len(lote) >= TAMANHO_LOTE_ESCRITA:
+            await descarregar()
+
+    if lote:
+        await descarregar()
+
+    print(f"📥 [Logs] Ingestão: {resumo['gravados']} gravados em {resumo['lotes']} lotes, "
+          f"{resumo['rejeitados']} rejeitados.")
+    return resumo
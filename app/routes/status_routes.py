@@ -7,9 +7,16 @@
 
 import os
 import time
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import FileResponse
 from google.cloud import firestore
 from openai import OpenAI
+from app.services.collection_registry import registro_colecoes
+from app.services.prompt_templates import CONTAGEM_TOKENS, TEMPLATES, MIN_TOKENS_CACHE
+from app.services.retrieval_snapshot import snapshot_atual
+from app.services.usage_metrics import resumo_uso
+from app.utils.profiling import caminho_artefato, verificar_admin
+from app.utils.tiered_cache import metricas_caches
 
 router = APIRouter(prefix="/status", tags=["Status"])
 
@@ -55,6 +62,7 @@ def status_endpoint():
 
     firestore_ok = verificar_firestore()
     openai_ok = verificar_openai()
+    snapshot = snapshot_atual()
 
     status = {
         "status": "🟢 OK" if firestore_ok and openai_ok else "🟠 Parcial" if firestore_ok else "🔴 Indisponível",
@@ -63,6 +71,8 @@ def status_endpoint():
         "project_id": os.getenv("PROJECT_ID", "❓ Não definido"),
         "env": os.getenv("ENVIRONMENT", "dev").upper(),
         "region": os.getenv("REGION", "us-central1"),
+        "snapshot": f"v{snapshot.versao} ({len(snapshot)} docs)" if snapshot else "não carregado",
+        "pid": os.getpid(),
         "runtime": f"{time.time() - start_time:.2f}s",
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
     }
@@ -71,3 +81,64 @@ def status_endpoint():
     print(f"📊 [Status] {status}")
 
     return status
+
+
+# ==============================================================
+# 📈 Uso de tokens e cache de prompt
+# ==============================================================
+
+@router.get("/uso")
+def uso_endpoint():
+    """Tokens por template de prompt e proporção servida pelo cache do provedor."""
+    return {
+        "templates": {
+            t.template_id: {
+                "tokens_prefixo": t.tokens_prefixo,
+                "elegivel_cache": t.elegivel_cache,
+            }
+            for t in TEMPLATES.values()
+        },
+        "min_tokens_cache": MIN_TOKENS_CACHE,
+        # "estimativa": tokens_prefixo ≈ caracteres / 4 (tiktoken indisponível)
+        "contagem_tokens": CONTAGEM_TOKENS,
+        "uso": resumo_uso(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+# ==============================================================
+# 🧊 Cache em dois níveis
+# ==============================================================
+
+@router.get("/cache")
+def cache_endpoint():
+    """Acertos, falhas e erros por nível (L1 do processo, L2 compartilhado) de cada cache."""
+    return {
+        "caches": metricas_caches(),
+        "pid": os.getpid(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+# ==============================================================
+# 🗂️ Coleções registradas
+# ==============================================================
+
+@router.get("/colecoes")
+def colecoes_endpoint():
+    """Coleções descobertas com tamanho, frescor e uso pelo roteador."""
+    return {
+        "colecoes": registro_colecoes.estatisticas(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+# ==============================================================
+# 🔬 Artefatos de profiling
+# ==============================================================
+
+@router.get("/profiles/{nome}")
+def profile_endpoint(nome: str, request: Request):
+    """Download de um artefato de profiling (.pstats ou .collapsed). Requer X-Admin-Token."""
+    verificar_admin(request)
+    return FileResponse(caminho_artefato(nome), media_type="application/octet-stream", filename=nome)
@@ -0,0 +1,294 @@
+# ==============================================================
+# 📊 app/services/aggregates.py
+# --------------------------------------------------------------
+# Agregados de saúde mantidos de forma incremental.
+# Cada documento de log observado atualiza contadores por coleção,
+# nível, assinatura de erro e janela de tempo (hora/dia).
+# A sincronização por marca d'água é a única fonte de contagem e
+# lê apenas os últimos JANELA_DIAS dias de cada coleção.
+# Perguntas gerenciais recebem esses indicadores como uma tabela
+# compacta, em vez de depender de uma amostra de linhas de log.
+# ==============================================================
+
+import os
+import re
+import time
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime, timedelta, timezone
+from firebase_admin import firestore
+from app.services.firestore_client import get_firestore_client
+
+# ==============================================================
+# ⚙️ Configuração
+# ==============================================================
+
+JANELA_HORAS = int(os.getenv("AGREGADOS_JANELA_HORAS", "48"))
+JANELA_DIAS = int(os.getenv("AGREGADOS_JANELA_DIAS", "30"))
+MAX_ASSINATURAS = int(os.getenv("AGREGADOS_MAX_ASSINATURAS", "500"))
+MAX_IDS_OBSERVADOS = int(os.getenv("AGREGADOS_MAX_IDS", "100000"))
+LIMITE_SINCRONIZACAO = int(os.getenv("AGREGADOS_LIMITE_SINCRONIZACAO", "500"))  # documentos por página
+MAX_PAGINAS_SINCRONIZACAO = int(os.getenv("AGREGADOS_MAX_PAGINAS", "20"))   # páginas por coleção e chamada
+INTERVALO_SINCRONIZACAO = int(os.getenv("AGREGADOS_INTERVALO_SEGUNDOS", "60"))
+TIMEOUT_LEITURA_SEGUNDOS = 30
+
+NIVEIS_ERRO = {"ERROR", "ERRO", "CRITICAL", "FATAL"}
+NIVEIS_ALERTA = {"WARN", "WARNING", "ALERTA"}
+
+
+# ==============================================================
+# 🔧 Funções auxiliares
+# ==============================================================
+
+def normalizar_nivel(data: dict) -> str:
+    """Extrai o nível do log (level/severity) em caixa alta."""
+    nivel = data.get("level") or data.get("severity") or data.get("nivel")
+    return str(nivel).strip().upper() if nivel else "DESCONHECIDO"
+
+
+def converter_timestamp(valor):
+    """Converte o timestamp do documento (datetime, ISO ou epoch) para datetime UTC."""
+    if valor is None:
+        return None
+    try:
+        if isinstance(valor, datetime):
+            dt = valor
+        elif isinstance(valor, (int, float)):
+            # Aceita epoch em segundos ou milissegundos
+            dt = datetime.fromtimestamp(valor / 1000 if valor > 1e11 else valor, tz=timezone.utc)
+        else:
+            dt = datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+    except (ValueError, OverflowError, OSError):
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def maior_timestamp(*valores):
+    """Retorna o maior timestamp entre os valores informados (ignora None)."""
+    validos = [v for v in valores if v is not None]
+    if not validos:
+        return None
+    try:
+        return max(validos)
+    except TypeError:
+        # Tipos incomparáveis (ex.: str e datetime) → mantém o primeiro válido
+        return validos[0]
+
+
+_RE_VARIAVEIS = [
+    (re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"), "<uuid>"),
+    (re.compile(r"\b0x[0-9a-f]+\b|\b[0-9a-f]{16,}\b"), "<hex>"),
+    (re.compile(r"\d+"), "#"),
+    (re.compile(r"\s+"), " "),
+]
+
+def assinatura_erro(data: dict) -> str:
+    """
+    Gera a assinatura de um erro: a mensagem sem partes variáveis
+    (ids, números, hashes), para agrupar ocorrências do mesmo problema.
+    """
+    mensagem = data.get("message") or data.get("mensagem") or data.get("erro") or ""
+    mensagem = str(mensagem).lower()
+    for padrao, substituto in _RE_VARIAVEIS:
+        mensagem = padrao.sub(substituto, mensagem)
+    return mensagem.strip()[:90] or "(sem mensagem)"
+
+
+# ==============================================================
+# 🧮 Agregador incremental
+# ==============================================================
+
+class AgregadosSaude:
+    """Contadores incrementais de saúde dos sistemas, por coleção e janela de tempo."""
+
+    def __init__(self, janela_horas: int = JANELA_HORAS, janela_dias: int = JANELA_DIAS,
+                 max_assinaturas: int = MAX_ASSINATURAS, max_ids: int = MAX_IDS_OBSERVADOS):
+        self.janela_horas = janela_horas
+        self.janela_dias = janela_dias
+        self.max_assinaturas = max_assinaturas
+        self.max_ids = max_ids
+
+        self.por_hora = defaultdict(Counter)        # (coleção, "AAAA-MM-DDTHH") → nível → total
+        self.por_dia = defaultdict(Counter)         # (coleção, "AAAA-MM-DD") → nível → total
+        self.assinaturas = Counter()                # (coleção, assinatura) → ocorrências
+        self.marcas_d_agua = {}                     # coleção → maior timestamp sincronizado
+        self.em_dia = set()                         # coleções com a janela inteira já lida
+
+        self._ids_observados = OrderedDict()
+        self._hora_mais_recente = None
+        self._lock = threading.Lock()
+        self._periodico = False
+
+    # ----------------------------------------------------------
+    # 📥 Observação de documentos
+    # ----------------------------------------------------------
+    def observar(self, colecao: str, doc_id: str, data: dict) -> bool:
+        """
+        Contabiliza um documento de log. Documentos já observados são ignorados.
+        Retorna True se o documento foi contabilizado.
+        """
+        chave = (colecao, doc_id)
+        nivel = normalizar_nivel(data)
+        instante = converter_timestamp(data.get("timestamp"))
+
+        with self._lock:
+            if chave in self._ids_observados:
+                return False
+            self._ids_observados[chave] = True
+            if len(self._ids_observados) > self.max_ids:
+                self._ids_observados.popitem(last=False)
+
+            if nivel in NIVEIS_ERRO or nivel in NIVEIS_ALERTA:
+                self.assinaturas[(colecao, assinatura_erro(data))] += 1
+                if len(self.assinaturas) > self.max_assinaturas:
+                    self._podar_assinaturas()
+
+            if instante is not None:
+                self.por_hora[(colecao, instante.strftime("%Y-%m-%dT%H"))][nivel] += 1
+                self.por_dia[(colecao, instante.strftime("%Y-%m-%d"))][nivel] += 1
+                if self._hora_mais_recente is None or instante > self._hora_mais_recente:
+                    self._hora_mais_recente = instante
+                    self._podar_janelas()
+
+        return True
+
+    def _podar_assinaturas(self):
+        """Mantém apenas as assinaturas mais frequentes (limite de memória)."""
+        mantidas = self.assinaturas.most_common(self.max_assinaturas // 2)
+        self.assinaturas = Counter(dict(mantidas))
+
+    def _podar_janelas(self):
+        """Descarta janelas de hora/dia fora do período de retenção."""
+        limite_hora = (self._hora_mais_recente - timedelta(hours=self.janela_horas)).strftime("%Y-%m-%dT%H")
+        limite_dia = (self._hora_mais_recente - timedelta(days=self.janela_dias)).strftime("%Y-%m-%d")
+
+        for chave in [k for k in self.por_hora if k[1] < limite_hora]:
+            del self.por_hora[chave]
+        for chave in [k for k in self.por_dia if k[1] < limite_dia]:
+            del self.por_dia[chave]
+
+    # ----------------------------------------------------------
+    # 🔄 Sincronização incremental com o Firestore
+    # ----------------------------------------------------------
+    def sincronizar(self, colecoes: list, limite: int = LIMITE_SINCRONIZACAO,
+                    max_paginas: int = MAX_PAGINAS_SINCRONIZACAO) -> int:
+        """
+        Lê, em ordem crescente de timestamp, os documentos posteriores à marca
+        d'água de cada coleção (na primeira execução, a partir do início da
+        janela de `janela_dias`), em páginas de `limite` até alcançar o fim ou
+        `max_paginas` páginas. O restante é completado nas chamadas seguintes,
+        a partir da marca d'água; até lá, a coleção aparece como parcial na tabela.
+        Retorna quantos documentos novos foram contabilizados.
+        """
+        db = get_firestore_client()
+        novos = 0
+
+        for col in colecoes:
+            try:
+                marca = self.marcas_d_agua.get(col)
+                if marca is None:
+                    marca = datetime.now(timezone.utc) - timedelta(days=self.janela_dias)
+                query = db.collection(col).where("timestamp", ">", marca)
+                query = query.order_by("timestamp", direction=firestore.Query.ASCENDING).limit(limite)
+
+                ultimo_doc = None
+                for _ in range(max_paginas):
+                    pagina = query.start_after(ultimo_doc) if ultimo_doc is not None else query
+                    lidos = 0
+                    for doc in pagina.stream(timeout=TIMEOUT_LEITURA_SEGUNDOS):
+                        data = doc.to_dict()
+                        if self.observar(col, doc.id, data):
+                            novos += 1
+                        marca = maior_timestamp(marca, data.get("timestamp"))
+                        ultimo_doc = doc
+                        lidos += 1
+
+                    self.marcas_d_agua[col] = marca
+                    if lidos < limite:
+                        self.em_dia.add(col)
+                        break
+                else:
+                    self.em_dia.discard(col)
+            except Exception as e:
+                print(f"⚠️ [Agregados] Erro ao sincronizar {col}: {e}")
+
+        print(f"📊 [Agregados] {novos} documentos novos contabilizados.")
+        return novos
+
+    def iniciar_sincronizacao_periodica(self, obter_colecoes, intervalo: int = INTERVALO_SINCRONIZACAO):
+        """
+        Sincroniza as coleções de `obter_colecoes()` a cada `intervalo` segundos,
+        em background: as requisições só leem a tabela já agregada.
+        """
+        if self._periodico:
+            return
+        self._periodico = True
+
+        def executar():
+            while True:
+                try:
+                    self.sincronizar(obter_colecoes())
+                except Exception as e:
+                    print(f"⚠️ [Agregados] Erro na sincronização periódica: {e}")
+                time.sleep(intervalo)
+
+        threading.Thread(target=executar, daemon=True).start()
+
+    # ----------------------------------------------------------
+    # 📋 Tabela compacta para o prompt
+    # ----------------------------------------------------------
+    def tabela(self, top_assinaturas: int = 5, dias_tendencia: int = 7) -> str:
+        """
+        Formata os indicadores agregados como tabela compacta (texto).
+        Os totais por coleção cobrem a janela de `janela_dias` dias.
+        """
+        with self._lock:
+            if not self.por_dia:
+                return ""
+
+            totais = defaultdict(Counter)
+            for (col, _), contagem in self.por_dia.items():
+                totais[col].update(contagem)
+
+            linhas = [f"coleção | total_{self.janela_dias}d | erros | alertas | taxa_erro | erros_24h | cobertura"]
+            limite_24h = None
+            if self._hora_mais_recente is not None:
+                limite_24h = (self._hora_mais_recente - timedelta(hours=24)).strftime("%Y-%m-%dT%H")
+
+            for col in sorted(totais):
+                niveis = totais[col]
+                total = sum(niveis.values())
+                erros = sum(n for nivel, n in niveis.items() if nivel in NIVEIS_ERRO)
+                alertas = sum(n for nivel, n in niveis.items() if nivel in NIVEIS_ALERTA)
+                erros_24h = sum(
+                    n
+                    for (c, hora), contagem in self.por_hora.items()
+                    if c == col and limite_24h is not None and hora >= limite_24h
+                    for nivel, n in contagem.items() if nivel in NIVEIS_ERRO
+                )
+                taxa = f"{erros / total:.1%}" if total else "-"
+                cobertura = "completa" if col in self.em_dia else "parcial"
+                linhas.append(f"{col} | {total} | {erros} | {alertas} | {taxa} | {erros_24h} | {cobertura}")
+
+            dias = sorted({dia for _, dia in self.por_dia})[-dias_tendencia:]
+            if dias:
+                linhas.append("")
+                linhas.append("dia | total | erros")
+                for dia in dias:
+                    contagens = [c for (_, d), c in self.por_dia.items() if d == dia]
+                    total = sum(sum(c.values()) for c in contagens)
+                    erros = sum(n for c in contagens for nivel, n in c.items() if nivel in NIVEIS_ERRO)
+                    linhas.append(f"{dia} | {total} | {erros}")
+
+            principais = self.assinaturas.most_common(top_assinaturas)
+            if principais:
+                linhas.append("")
+                linhas.append("principais assinaturas de erro | coleção | ocorrências")
+                for (col, assinatura), n in principais:
+                    linhas.append(f"{assinatura} | {col} | {n}")
+
+            return "\n".join(linhas)
+
+
+# Instância compartilhada pelo processo
+agregados = AgregadosSaude()
@@ -0,0 +1,358 @@
+# ==============================================================
+# 🗂️ app/services/collection_registry.py
+# --------------------------------------------------------------
+# Registro dinâmico das coleções de logs.
+# - Descobre as coleções `*_logs` do Firestore na inicialização
+#   e periodicamente (novos sistemas entram sem mudar código).
+# - Mantém um shard por coleção com tamanho, frescor e um
+#   centróide dos vetores locais (feature hashing) dos logs.
+# - O roteador escolhe os N shards mais prováveis para a pergunta
+#   combinando a similaridade com os centróides (centralizados,
+#   para destacar o vocabulário próprio de cada sistema) e os
+#   termos do nome da coleção. O custo da consulta não cresce
+#   com o número de coleções.
+# - A amostra lida para os centróides também ajusta o IDF do
+#   backend local quando ainda não há um publicado.
+# ==============================================================
+
+import os
+import re
+import time
+import threading
+import numpy as np
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from firebase_admin import firestore
+from app.services.aggregates import converter_timestamp, maior_timestamp
+from app.services.embedding_backends import (
+    HashingEmbeddingBackend,
+    normalizar_texto_local,
+    publicar_idf_se_ausente,
+)
+from app.services.firestore_client import get_firestore_client
+
+# ==============================================================
+# ⚙️ Configuração
+# ==============================================================
+
+SUFIXO_COLECOES = os.getenv("COLECOES_SUFIXO", "_logs")
+INTERVALO_DESCOBERTA = int(os.getenv("COLECOES_DESCOBERTA_SEGUNDOS", "300"))
+MAX_SHARDS = int(os.getenv("ROTEAMENTO_MAX_SHARDS", "4"))
+SCORE_MINIMO = float(os.getenv("ROTEAMENTO_SCORE_MINIMO", "0.05"))
+# Aliases extras por coleção, ex.: "vida_nova_logs=vn|seguro vida;viagem_transmissao_logs=tms"
+PRIORES_EXTRAS = os.getenv("ROTEAMENTO_PRIORES", "")
+
+FRACAO_DO_MELHOR = 0.6      # shards abaixo de 60% do melhor score ficam de fora
+PESO_PRIOR = 0.5            # peso dos termos do nome da coleção
+AMOSTRA_CENTROIDE = 50      # documentos por página lida para o centróide
+MAX_PAGINAS_CENTROIDE = 20  # páginas por shard a cada atualização (o restante fica para a próxima)
+DECAIMENTO_CENTROIDE = 0.9  # vocabulário antigo perde peso aos poucos
+
+ANTIGO = datetime.min.replace(tzinfo=timezone.utc)
+
+# Vetorizador próprio com IDF uniforme: os centroides acumulados continuam
+# comparáveis mesmo depois que um IDF ajustado é publicado para a recuperação
+_vetorizador = HashingEmbeddingBackend()
+
+# Usadas apenas se a descoberta falhar antes de qualquer sucesso
+COLECOES_CONHECIDAS = [
+    "vida_nova_logs",
+    "controle_auditoria_logs",
+    "orcamento_contratacao_logs",
+    "viagem_transmissao_logs",
+]
+
+
+# ==============================================================
+# 🔧 Funções auxiliares
+# ==============================================================
+
+def tokens(texto: str) -> set:
+    return set(re.findall(r"[a-z0-9]{2,}", normalizar_texto_local(texto)))
+
+
+def termos_colecao(nome: str, extras: list = ()) -> list:
+    """
+    Termos de roteamento derivados do nome da coleção:
+    o nome completo ("vida nova") e cada palavra isolada ("vida", "nova").
+    """
+    palavras = [p for p in nome.lower().split("_") if len(p) >= 2 and p != "logs"]
+    termos = [tuple(palavras)] + [(p,) for p in palavras]
+    termos += [tuple(sorted(tokens(e))) for e in extras if tokens(e)]
+    return [t for t in termos if t]
+
+
+def carregar_priores(config: str) -> dict:
+    """Converte "colecao=termo|termo;..." em dicionário."""
+    priores = {}
+    for item in config.split(";"):
+        if "=" in item:
+            colecao, termos = item.split("=", 1)
+            priores[colecao.strip()] = [t.strip() for t in termos.split("|") if t.strip()]
+    return priores
+
+
+# ==============================================================
+# 🧩 Shard por coleção
+# ==============================================================
+
+@dataclass
+class ShardColecao:
+    nome: str
+    termos: list
+    documentos: int = None          # contagem do Firestore (agregação)
+    ultimo_timestamp: object = None  # documento mais recente conhecido
+    centroide: np.ndarray = None
+    marca_centroide: object = None   # último timestamp incorporado ao centróide
+    amostras: int = 0
+    consultas: int = 0
+    descoberto_em: float = field(default_factory=time.time)
+    atualizado_em: float = 0.0
+
+    def incorporar(self, vetores: list, decair: bool = True):
+        """
+        Acrescenta vetores ao centróide. Com `decair`, o histórico perde peso
+        antes (uma vez por atualização, não por página lida).
+        """
+        vetores = [v for v in vetores if len(v)]
+        if not vetores:
+            return
+        soma = np.sum(np.asarray(vetores, dtype=np.float32), axis=0)
+        if self.centroide is None:
+            self.centroide = soma
+        else:
+            self.centroide = (DECAIMENTO_CENTROIDE if decair else 1.0) * self.centroide + soma
+        self.amostras += len(vetores)
+
+    def prior(self, termos_pergunta: set) -> float:
+        """Fração do melhor termo do nome presente na pergunta (0 a 1)."""
+        return max((len(set(t) & termos_pergunta) / len(t) for t in self.termos), default=0.0)
+
+    def estatisticas(self) -> dict:
+        ultimo = self.ultimo_timestamp
+        return {
+            "colecao": self.nome,
+            "documentos": self.documentos,
+            "ultimo_timestamp": ultimo.isoformat() if hasattr(ultimo, "isoformat") else ultimo,
+            "amostras_centroide": self.amostras,
+            "consultas": self.consultas,
+            "atualizado_em": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.atualizado_em))
+            if self.atualizado_em else None,
+        }
+
+
+# ==============================================================
+# 🗂️ Registro e roteador
+# ==============================================================
+
+class RegistroColecoes:
+    """Coleções descobertas, seus shards e o roteamento de perguntas."""
+
+    def __init__(self, sufixo: str = SUFIXO_COLECOES, intervalo: int = INTERVALO_DESCOBERTA):
+        self.sufixo = sufixo
+        self.intervalo = intervalo
+        self._shards = {}
+        self._priores = carregar_priores(PRIORES_EXTRAS)
+        self._ordem = []
+        self._matriz = None
+        self._ultima_atualizacao = 0.0
+        self._periodico = False
+        self._lock = threading.Lock()
+        self._lock_atualizacao = threading.RLock()
+
+    # ----------------------------------------------------------
+    # 🔭 Descoberta
+    # ----------------------------------------------------------
+    def descobrir(self) -> list:
+        """Nomes das coleções `*{sufixo}` existentes no Firestore ([] em caso de falha)."""
+        try:
+            db = get_firestore_client()
+            return sorted(c.id for c in db.collections() if c.id.endswith(self.sufixo))
+        except Exception as e:
+            print(f"⚠️ [Coleções] Falha na descoberta: {e}")
+            return []
+
+    def _atualizar_shard(self, db, shard: ShardColecao) -> list:
+        """
+        Atualiza tamanho, frescor e centróide com os documentos novos.
+        Na primeira vez, o centróide parte dos documentos mais recentes; depois,
+        lê em ordem crescente a partir da marca, página a página, até esgotar os
+        novos (ou MAX_PAGINAS_CENTROIDE páginas; a marca garante a continuação).
+        Retorna os textos lidos.
+        """
+        from app.services.firestore_context import LIMITE_TEXTO_EMBEDDING, extrair_texto_log
+
+        query = db.collection(shard.nome)
+        if shard.marca_centroide is None:
+            paginas = 1
+            query = query.order_by("timestamp", direction=firestore.Query.DESCENDING)
+        else:
+            paginas = MAX_PAGINAS_CENTROIDE
+            query = (
+                query.where("timestamp", ">", shard.marca_centroide)
+                .order_by("timestamp", direction=firestore.Query.ASCENDING)
+            )
+        query = query.limit(AMOSTRA_CENTROIDE)
+
+        ultimo_doc = None
+        lidos = []
+        for pagina in range(paginas):
+            docs = query.start_after(ultimo_doc) if ultimo_doc is not None else query
+            textos = []
+            for doc in docs.stream():
+                data = doc.to_dict()
+                shard.marca_centroide = maior_timestamp(shard.marca_centroide, data.get("timestamp"))
+                textos.append(extrair_texto_log(data)[:LIMITE_TEXTO_EMBEDDING])
+                ultimo_doc = doc
+            shard.incorporar(_vetorizador.gerar_lote(textos), decair=pagina == 0)
+            lidos.extend(textos)
+            if len(textos) < AMOSTRA_CENTROIDE:
+                break
+        shard.ultimo_timestamp = maior_timestamp(shard.ultimo_timestamp, shard.marca_centroide)
+
+        try:
+            shard.documentos = db.collection(shard.nome).count().get()[0][0].value
+        except Exception:
+            pass  # contagem por agregação indisponível: mantém o último valor
+
+        shard.atualizado_em = time.time()
+        return lidos
+
+    def atualizar(self):
+        """
+        Redescobre as coleções e atualiza os shards (e a matriz de roteamento).
+        Sem IDF publicado, ajusta-o com os textos lidos dos shards.
+        """
+        with self._lock_atualizacao:
+            descobertas = self.descobrir()
+            nomes = descobertas or list(self._shards) or list(COLECOES_CONHECIDAS)
+            db = get_firestore_client()
+
+            shards = {}
+            corpus = []
+            for nome in nomes:
+                shard = self._shards.get(nome)
+                if shard is None:
+                    shard = ShardColecao(nome, termos_colecao(nome, self._priores.get(nome, [])))
+                    print(f"🆕 [Coleções] Nova coleção registrada: {nome}")
+                try:
+                    corpus.extend(self._atualizar_shard(db, shard))
+                except Exception as e:
+                    print(f"⚠️ [Coleções] Erro ao atualizar {nome}: {e}")
+                shards[nome] = shard
+
+            with self._lock:
+                self._shards = shards
+                self._reconstruir_matriz()
+                self._ultima_atualizacao = time.monotonic()
+
+            print(f"🗂️ [Coleções] {len(shards)} coleções registradas.")
+            publicar_idf_se_ausente(corpus)
+
+    def _reconstruir_matriz(self):
+        """Centróides normalizados e centralizados (realça o vocabulário próprio)."""
+        self._ordem = list(self._shards)
+        dimensoes = _vetorizador.dimensoes
+        matriz = np.zeros((len(self._ordem), dimensoes), dtype=np.float32)
+        for i, nome in enumerate(self._ordem):
+            centroide = self._shards[nome].centroide
+            if centroide is not None and np.linalg.norm(centroide):
+                matriz[i] = centroide / np.linalg.norm(centroide)
+
+        possui = np.linalg.norm(matriz, axis=1) > 0
+        if possui.sum() > 1:
+            matriz[possui] -= matriz[possui].mean(axis=0)
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        self._matriz = matriz / normas
+
+    def _garantir_atualizado(self):
+        """
+        Primeira descoberta síncrona; depois, a thread periódica assume (ou o acesso, se não houver).
+        Se outra atualização estiver em andamento, aguarda o seu resultado em vez de repeti-la.
+        """
+        vista = self._ultima_atualizacao
+        if vista and (self._periodico or time.monotonic() - vista <= self.intervalo):
+            return
+        with self._lock_atualizacao:
+            if self._ultima_atualizacao == vista:
+                self.atualizar()
+
+    def iniciar_descoberta_periodica(self):
+        """Descoberta inicial e atualizações a cada `intervalo` segundos, em background."""
+        if self._periodico:
+            return
+        self._periodico = True
+
+        def executar():
+            while True:
+                try:
+                    self.atualizar()
+                except Exception as e:
+                    print(f"⚠️ [Coleções] Erro na atualização periódica: {e}")
+                time.sleep(self.intervalo)
+
+        threading.Thread(target=executar, daemon=True).start()
+
+    # ----------------------------------------------------------
+    # 📋 Consulta
+    # ----------------------------------------------------------
+    def nomes(self) -> list:
+        self._garantir_atualizado()
+        return list(self._shards)
+
+    def observar(self, colecao: str, timestamp):
+        """Atualiza o frescor do shard com um documento lido na recuperação."""
+        shard = self._shards.get(colecao)
+        if shard is not None:
+            shard.ultimo_timestamp = maior_timestamp(shard.ultimo_timestamp, timestamp)
+
+    def estatisticas(self) -> list:
+        self._garantir_atualizado()
+        return [s.estatisticas() for s in self._shards.values()]
+
+    # ----------------------------------------------------------
+    # 🧭 Roteamento
+    # ----------------------------------------------------------
+    def rotear(self, pergunta: str, n: int = MAX_SHARDS) -> list:
+        """
+        Retorna as coleções mais prováveis para a pergunta (até `n`).
+        Sem sinal suficiente, usa os `n` shards com dados mais recentes.
+        """
+        self._garantir_atualizado()
+        with self._lock:
+            ordem, matriz, shards = self._ordem, self._matriz, self._shards
+        if not ordem:
+            return []
+
+        termos_pergunta = tokens(pergunta)
+        vetor = _vetorizador.gerar(pergunta)
+        similaridades = matriz @ np.asarray(vetor, dtype=np.float32) if vetor else np.zeros(len(ordem))
+
+        scores = {
+            nome: float(similaridades[i]) + PESO_PRIOR * shards[nome].prior(termos_pergunta)
+            for i, nome in enumerate(ordem)
+        }
+        melhor = max(scores.values())
+        if melhor >= SCORE_MINIMO:
+            escolhidas = sorted(
+                (nome for nome, score in scores.items() if score >= FRACAO_DO_MELHOR * melhor),
+                key=scores.get, reverse=True,
+            )[:n]
+        else:
+            print("⚠️ Nenhum sinal de roteamento forte, usando as coleções com dados mais recentes.")
+            escolhidas = [s.nome for s in sorted(
+                shards.values(), key=lambda s: (converter_timestamp(s.ultimo_timestamp) or ANTIGO), reverse=True
+            )[:n]]
+
+        for nome in escolhidas:
+            shards[nome].consultas += 1
+        print(f"🧭 [Roteamento] {', '.join(f'{c} ({scores[c]:.2f})' for c in escolhidas)}")
+        return escolhidas
+
+
+# ==============================================================
+# 🧠 Instância compartilhada
+# ==============================================================
+
+registro_colecoes = RegistroColecoes()
@@ -0,0 +1,375 @@
+# ==============================================================
+# 🧮 app/services/embedding_backends.py
+# --------------------------------------------------------------
+# Backends de embedding intercambiáveis.
+# - openai: `text-embedding-3-small` via API (padrão)
+# - local:  TF-IDF com feature hashing de n-gramas de caracteres,
+#           vetorizado com NumPy, sem rede e sem latência externa
+# O backend é escolhido por implantação (EMBEDDING_BACKEND) e,
+# no modo "auto", o local assume quando a OpenAI falha; após
+# falhas seguidas, um disjuntor põe o local na frente por um
+# período de espera, sem aguardar o timeout da OpenAI a cada pergunta.
+# Cada backend tem um nome próprio, usado para separar caches,
+# stores compactos e snapshots (vetores de espaços diferentes
+# nunca são comparados entre si).
+# O IDF do backend local é ajustado uma vez (pela amostra inicial
+# do registro de coleções ou pelo construtor do snapshot, o que vier
+# primeiro) e publicado em arquivo; todos os workers o carregam,
+# de modo que o nome do backend (e seus vetores) coincidem.
+# ==============================================================
+
+import os
+import re
+import time
+import zlib
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+from app.utils.tiered_cache import ESPERA_MAXIMA_SEGUNDOS, obter_cache
+
+# ==============================================================
+# ⚙️ Configuração
+# ==============================================================
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai").lower()  # openai | local | auto
+DIMENSOES_LOCAL = int(os.getenv("EMBEDDING_LOCAL_DIMENSOES", "1024"))
+TTL_CACHE_EMBEDDINGS = int(os.getenv("CACHE_TTL_EMBEDDINGS_SEGUNDOS", str(7 * 24 * 3600)))
+CAMINHO_IDF = os.getenv(
+    "EMBEDDING_LOCAL_IDF_ARQUIVO",
+    os.path.join(os.getenv("SNAPSHOT_DIR", "/tmp/retrieval_snapshot"), "idf_local.npy"),
+)
+INTERVALO_VERIFICACAO_IDF = 10
+# Modo auto: timeout do backend principal quando há fallback e disjuntor
+TIMEOUT_COM_FALLBACK = float(os.getenv("EMBEDDING_AUTO_TIMEOUT_SEGUNDOS", "2"))
+FALHAS_PARA_ABRIR = int(os.getenv("EMBEDDING_AUTO_FALHAS", "3"))
+ESPERA_DISJUNTOR_SEGUNDOS = int(os.getenv("EMBEDDING_AUTO_ESPERA_SEGUNDOS", "60"))
+
+
+# ==============================================================
+# 🧩 Interface
+# ==============================================================
+
+class EmbeddingBackend:
+    """Interface comum dos backends de embedding."""
+
+    nome = "base"
+
+    def gerar(self, texto: str, timeout: float = None) -> list:
+        """
+        Gera o embedding de um texto (lista ou ndarray float32, quando vem
+        do cache). Retorna [] em caso de falha: teste com len(), não com bool.
+        """
+        raise NotImplementedError
+
+    def gerar_lote(self, textos: list, timeout: float = None) -> list:
+        """Gera embeddings de vários textos (mesma ordem da entrada)."""
+        return [self.gerar(t, timeout=timeout) for t in textos]
+
+    def em_cache(self, texto: str):
+        """Embedding já disponível sem custo de API (ou None); não gera um novo."""
+        return None
+
+
+# ==============================================================
+# ☁️ Backend OpenAI
+# ==============================================================
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """
+    Embeddings do `text-embedding-3-small` (dimensão opcionalmente reduzida).
+    Passam pelo cache em dois níveis: um texto já vetorizado por qualquer
+    instância não gera nova chamada à API. O backend local não usa cache
+    (calcular é mais rápido que uma ida ao L2).
+    """
+
+    @property
+    def nome(self) -> str:
+        from app.services.openai_client import EMBEDDING_DIMENSOES
+        return f"openai-3-small-{EMBEDDING_DIMENSOES or 1536}"
+
+    def gerar(self, texto: str, timeout: float = None) -> list:
+        from app.services.openai_client import generate_embedding
+        if not texto or not isinstance(texto, str):
+            return []
+        cache = obter_cache("embeddings", TTL_CACHE_EMBEDDINGS)
+        return cache.obter_ou_calcular(
+            f"{self.nome}:{texto}",
+            lambda: generate_embedding(texto, timeout=timeout),
+            espera_maxima=min(timeout, ESPERA_MAXIMA_SEGUNDOS) if timeout else ESPERA_MAXIMA_SEGUNDOS,
+        )
+
+    def gerar_lote(self, textos: list, timeout: float = None) -> list:
+        """Consulta o cache e gera os ausentes em chamadas em lote (textos repetidos uma vez só)."""
+        from app.services.openai_client import generate_embeddings_lote
+        cache = obter_cache("embeddings", TTL_CACHE_EMBEDDINGS)
+        resultado = [cache.obter(f"{self.nome}:{t}") if t else [] for t in textos]
+
+        pendentes = list(dict.fromkeys(t for t, v in zip(textos, resultado) if v is None))
+        if pendentes:
+            gerados = dict(zip(pendentes, generate_embeddings_lote(pendentes, timeout=timeout)))
+            for texto, embedding in gerados.items():
+                if embedding:
+                    cache.definir(f"{self.nome}:{texto}", embedding)
+            resultado = [gerados[t] if v is None else v for t, v in zip(textos, resultado)]
+        return resultado
+
+    def em_cache(self, texto: str):
+        if not texto:
+            return None
+        return obter_cache("embeddings", TTL_CACHE_EMBEDDINGS).obter(f"{self.nome}:{texto}")
+
+
+# ==============================================================
+# 💻 Backend local (feature hashing)
+# ==============================================================
+
+STOPWORDS_PT = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas",
+    "um", "uma", "uns", "umas", "para", "por", "com", "sem", "que", "se", "ao", "aos", "ou",
+    "qual", "quais", "como", "onde", "quando", "foi", "ser", "esta", "este", "isso", "sobre",
+    "the", "of", "to", "in", "and", "is", "at", "on",
+}
+
+_RE_TOKENS = re.compile(r"[a-z0-9_]{2,}")
+_RE_NUMEROS = re.compile(r"\d+")
+
+
+def normalizar_texto_local(texto: str) -> str:
+    """Minúsculas, sem acentos e com números colapsados (ids e contadores variam entre logs)."""
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return _RE_NUMEROS.sub("0", texto)
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    TF-IDF sobre n-gramas de caracteres (3 a 5) e palavras inteiras,
+    projetado em `dimensoes` posições por feature hashing com sinal.
+    Robusto a flexões do português ("falha", "falhas", "falhou") e a
+    variações de identificadores em mensagens de log.
+    """
+
+    def __init__(self, dimensoes: int = DIMENSOES_LOCAL, ngramas=(3, 4, 5), idf: np.ndarray = None):
+        self.dimensoes = dimensoes
+        self.ngramas = ngramas
+        self.idf = np.ones(dimensoes, dtype=np.float32)
+        self._versao_idf = "uniforme"
+        if idf is not None:
+            self._definir_idf(idf)
+
+    @property
+    def nome(self) -> str:
+        return f"local-hashing-v1-{self.dimensoes}-{self._versao_idf}"
+
+    def _features(self, texto: str) -> list:
+        features = []
+        for palavra in _RE_TOKENS.findall(normalizar_texto_local(texto)):
+            if palavra in STOPWORDS_PT:
+                continue
+            features.append("w:" + palavra)
+            marcada = f" {palavra} "
+            for n in self.ngramas:
+                features.extend(marcada[i:i + n] for i in range(len(marcada) - n + 1))
+        return features
+
+    def _hashes(self, texto: str) -> np.ndarray:
+        return np.fromiter(
+            (zlib.crc32(f.encode("utf-8")) for f in self._features(texto)), dtype=np.uint32
+        )
+
+    def _tf(self, texto: str) -> np.ndarray:
+        hashes = self._hashes(texto)
+        if len(hashes) == 0:
+            return np.zeros(self.dimensoes, dtype=np.float32)
+        indices = (hashes % self.dimensoes).astype(np.int64)
+        sinais = np.where((hashes >> 31) & 1, -1.0, 1.0)
+        tf = np.bincount(indices, weights=sinais, minlength=self.dimensoes).astype(np.float32)
+        return np.sign(tf) * np.log1p(np.abs(tf))  # TF sublinear
+
+    def ajustar_idf(self, corpus: list):
+        """
+        Calcula o IDF por posição a partir de um corpus de logs.
+        Altera o nome do backend (vetores antigos ficam em outro cache).
+        """
+        if not corpus:
+            return
+        df = np.zeros(self.dimensoes, dtype=np.float32)
+        for texto in corpus:
+            df += self._tf(texto) != 0
+        self._definir_idf(np.log((1 + len(corpus)) / (1 + df)) + 1)
+        print(f"💻 [Embeddings locais] IDF ajustado com {len(corpus)} documentos ({self._versao_idf}).")
+
+    def _definir_idf(self, idf: np.ndarray):
+        idf = np.asarray(idf, dtype=np.float32)
+        if idf.shape != (self.dimensoes,):
+            raise ValueError(f"IDF com formato {idf.shape}, esperado ({self.dimensoes},).")
+        self.idf = idf
+        self._versao_idf = hashlib.sha256(self.idf.tobytes()).hexdigest()[:8]
+
+    def salvar_idf(self, caminho: str):
+        """Grava o IDF de forma atômica (workers podem estar lendo o arquivo)."""
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        with open(caminho + ".tmp", "wb") as f:
+            np.save(f, self.idf)
+        os.replace(caminho + ".tmp", caminho)
+
+    def gerar(self, texto: str, timeout: float = None) -> list:
+        if not texto or not isinstance(texto, str):
+            return []
+        vetor = self._tf(texto) * self.idf
+        norma = np.linalg.norm(vetor)
+        if not norma:
+            return []
+        return (vetor / norma).tolist()
+
+    def em_cache(self, texto: str):
+        # Recalcular é local e barato: sempre disponível
+        return self.gerar(texto) or None
+
+
+# ==============================================================
+# 🔌 Disjuntor do backend principal (modo auto)
+# ==============================================================
+
+class Disjuntor:
+    """
+    Abre após `falhas_para_abrir` falhas seguidas e fica aberto por
+    `espera_segundos`; depois, a próxima tentativa decide: sucesso fecha,
+    falha reabre imediatamente.
+    """
+
+    def __init__(self, falhas_para_abrir: int = FALHAS_PARA_ABRIR,
+                 espera_segundos: float = ESPERA_DISJUNTOR_SEGUNDOS):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.espera_segundos = espera_segundos
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def aberto(self) -> bool:
+        return time.monotonic() < self._aberto_ate
+
+    def registrar(self, sucesso: bool):
+        with self._lock:
+            if sucesso:
+                self._falhas = 0
+                self._aberto_ate = 0.0
+                return
+            self._falhas += 1
+            if self._falhas >= self.falhas_para_abrir:
+                self._aberto_ate = time.monotonic() + self.espera_segundos
+                print(f"🔌 [Embeddings] {self._falhas} falhas seguidas da OpenAI: backend local "
+                      f"na frente pelos próximos {self.espera_segundos:.0f}s.")
+
+
+# ==============================================================
+# 🗂️ Seleção de backend
+# ==============================================================
+
+_openai = OpenAIEmbeddingBackend()
+_local = HashingEmbeddingBackend()
+
+BACKENDS = {
+    "openai": _openai,
+    "local": _local,
+}
+
+_disjuntor = Disjuntor()
+
+_idf_em_uso = None
+_ultima_verificacao_idf = 0.0
+_idf_lock = threading.Lock()
+
+
+def backend_local() -> HashingEmbeddingBackend:
+    """
+    Backend local com o IDF publicado em CAMINHO_IDF (uniforme enquanto não houver).
+    O arquivo é verificado no máximo a cada INTERVALO_VERIFICACAO_IDF segundos;
+    um IDF novo gera uma nova instância, e requisições em andamento seguem
+    com a anterior (vetores de um mesmo ranqueamento nunca misturam IDFs).
+    """
+    global _local, _idf_em_uso, _ultima_verificacao_idf
+
+    agora = time.monotonic()
+    if agora - _ultima_verificacao_idf < INTERVALO_VERIFICACAO_IDF:
+        return _local
+
+    with _idf_lock:
+        if agora - _ultima_verificacao_idf < INTERVALO_VERIFICACAO_IDF:
+            return _local
+        _ultima_verificacao_idf = agora
+
+        try:
+            versao_arquivo = os.stat(CAMINHO_IDF).st_mtime_ns
+        except OSError:
+            return _local
+        if versao_arquivo == _idf_em_uso:
+            return _local
+
+        _idf_em_uso = versao_arquivo
+        try:
+            _local = HashingEmbeddingBackend(DIMENSOES_LOCAL, idf=np.load(CAMINHO_IDF))
+            BACKENDS["local"] = _local
+            print(f"💻 [Embeddings locais] IDF carregado (pid {os.getpid()}, {_local.nome}).")
+        except (OSError, ValueError) as e:
+            print(f"⚠️ [Embeddings locais] Falha ao carregar o IDF de {CAMINHO_IDF}: {e}")
+        return _local
+
+
+def publicar_idf(corpus: list) -> HashingEmbeddingBackend:
+    """Ajusta o IDF sobre o corpus, publica o arquivo e passa a usá-lo neste processo."""
+    global _ultima_verificacao_idf
+    ajustado = HashingEmbeddingBackend(DIMENSOES_LOCAL)
+    ajustado.ajustar_idf(corpus)
+    ajustado.salvar_idf(CAMINHO_IDF)
+    _ultima_verificacao_idf = 0.0
+    return backend_local()
+
+
+def publicar_idf_se_ausente(corpus: list):
+    """
+    Publica o IDF a partir do corpus se a implantação usa o backend local
+    e ainda não há arquivo em CAMINHO_IDF. Sem corpus, avisa: o backend
+    local segue com IDF uniforme e ranqueia pior.
+    """
+    if EMBEDDING_BACKEND not in ("local", "auto") or os.path.exists(CAMINHO_IDF):
+        return
+    if not corpus:
+        print(f"🚨 [Embeddings locais] Nenhum IDF em {CAMINHO_IDF} e nenhum log para ajustá-lo: "
+              f"o backend local (modo {EMBEDDING_BACKEND}) está com IDF uniforme.")
+        return
+    try:
+        publicar_idf(corpus)
+    except OSError as e:
+        print(f"🚨 [Embeddings locais] Falha ao publicar o IDF em {CAMINHO_IDF}: {e} "
+              f"(backend local segue com IDF uniforme).")
+
+
+def obter_backends() -> list:
+    """
+    Backends em ordem de preferência para esta implantação:
+    - openai → [openai]
+    - local  → [local]
+    - auto   → [openai, local] (local como fallback automático), ou
+               [local, openai] enquanto o disjuntor estiver aberto
+    """
+    if EMBEDDING_BACKEND == "local":
+        return [backend_local()]
+    if EMBEDDING_BACKEND == "auto":
+        if _disjuntor.aberto:
+            return [backend_local(), _openai]
+        return [_openai, backend_local()]
+    return [_openai]
+
+
+def registrar_resultado(backend: EmbeddingBackend, sucesso: bool):
+    """Informa ao disjuntor o resultado de uma chamada à OpenAI no modo auto."""
+    if EMBEDDING_BACKEND == "auto" and backend is _openai:
+        _disjuntor.registrar(sucesso)
+
+
+def obter_backend() -> EmbeddingBackend:
+    """Backend principal da implantação."""
+    return obter_backends()[0]
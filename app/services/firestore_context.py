@@ -3,8 +3,16 @@
 #    com filtro semântico baseado em embeddings
 # ==============================================================
 
+import re
 import math
+import unicodedata
+from app.services.aggregates import maior_timestamp
+from app.services.collection_registry import registro_colecoes
+from app.services.embedding_backends import TIMEOUT_COM_FALLBACK, obter_backends, registrar_resultado
 from app.services.firestore_client import get_firestore_client
+from app.services.retrieval_snapshot import snapshot_atual
+from app.utils.embedding_store import obter_store
+from app.utils.deadline import Deadline, LIMIAR_POOL_REDUZIDO_SEGUNDOS, LIMIAR_RECENCIA_SEGUNDOS
 from app.utils.sanitize import sanitize_text
 from firebase_admin import firestore
 
@@ -22,107 +30,316 @@ def cosine_similarity(vec1, vec2):
 
 
 # --------------------------------------------------------------
-# 🔍 Função principal
+# 🗺️ Seleção de coleções a partir da pergunta
 # --------------------------------------------------------------
-def obter_contexto_firestone(pergunta: str, limite: int = 10) -> str:
-    from app.services.openai_client import generate_embedding
+def selecionar_colecoes(pergunta: str) -> list:
+    """Coleções mais prováveis para a pergunta, pelo roteador do registro de coleções."""
+    return registro_colecoes.rotear(pergunta)
+
+
+# --------------------------------------------------------------
+# 🧾 Funções auxiliares de documentos
+# --------------------------------------------------------------
+LIMITE_TEXTO_EMBEDDING = 500  # caracteres do log usados no embedding
+
+def extrair_texto_log(data: dict) -> str:
     """
-    Busca documentos no Firestore relacionados ao tema da pergunta.
-    Utiliza embeddings para ranquear semanticamente os logs.
-    Retorna um resumo textual consolidado para o modelo OpenAI.
+    Concatena os campos textuais do documento e aplica a sanitização.
+    Documentos gravados pelo /logs/ingest já trazem `texto_normalizado`.
     """
+    if isinstance(data.get("texto_normalizado"), str):
+        return data["texto_normalizado"]
+    texto_log = " ".join([str(v) for v in data.values() if isinstance(v, str)])
+    return sanitize_text(texto_log)
+
+
+def embedding_precalculado(data: dict, backend) -> list:
+    """Embedding gravado na ingestão, se foi gerado pelo mesmo backend (senão None)."""
+    embedding = data.get("embedding")
+    if not embedding or data.get("embedding_backend") != backend.nome:
+        return None
+    return list(embedding)
+
+
+def formatar_contexto(candidatos: list, limite_caracteres: int = 6000) -> str:
+    """Monta o contexto textual consolidado a partir dos candidatos ranqueados."""
+    contexto = [f"[{c['colecao']}] {c['texto']}" for c in candidatos]
+    return "\n".join(contexto)[:limite_caracteres]
+
+
+def normalizar_termos(texto: str) -> list:
+    """Termos em minúsculas e sem acentos (comparação tolerante)."""
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.findall(r"[a-z0-9_]{2,}", texto)
+
+
+def pontuar(termos_busca: set, texto: str) -> float:
+    """Fração dos termos da busca presentes no texto do log."""
+    if not termos_busca:
+        return 1.0
+    return len(termos_busca & set(normalizar_termos(texto))) / len(termos_busca)
+
+
+def ordenar_por_recencia(candidatos: list) -> list:
+    """Ordena candidatos do mais recente para o mais antigo (modo degradado)."""
+    try:
+        return sorted(candidatos, key=lambda c: c["timestamp"], reverse=True)
+    except TypeError:
+        # Timestamps ausentes ou incomparáveis → mantém a ordem de leitura (já decrescente)
+        return list(candidatos)
+
+
+# --------------------------------------------------------------
+# 📥 Leitura e ranqueamento dos documentos
+# --------------------------------------------------------------
+RANQUEAMENTOS = ("recencia", "lexico", "semantico", "hibrido")
+PESO_SEMANTICO_HIBRIDO = 0.7
+
+def embedding_pergunta(pergunta: str, deadline: Deadline = None):
+    """
+    Gera o embedding da pergunta com o primeiro backend disponível
+    (ex.: OpenAI e, no modo auto, o backend local como fallback).
+    Havendo fallback, o primeiro backend tem no máximo TIMEOUT_COM_FALLBACK
+    segundos, para não consumir o orçamento inteiro antes do fallback.
+    Retorna (backend, embedding) ou (None, []) se nenhum responder.
+    """
+    backends = obter_backends()
+    for i, backend in enumerate(backends):
+        timeout = deadline.orcamento_recuperacao() if deadline else None
+        if i < len(backends) - 1:
+            timeout = min(timeout, TIMEOUT_COM_FALLBACK) if timeout else TIMEOUT_COM_FALLBACK
+        embedding = backend.gerar(pergunta, timeout=timeout)
+        registrar_resultado(backend, len(embedding) > 0)
+        if len(embedding):
+            return backend, embedding
+        print(f"⚠️ Backend de embedding '{backend.nome}' indisponível para a pergunta.")
+    return None, []
+
+
+def buscar_candidatos(pergunta: str, colecoes: list, limite: int = 10,
+                      desde=None, pergunta_embedding=None, deadline: Deadline = None,
+                      backend=None, ranqueamento: str = "semantico") -> list:
+    """
+    Lê os documentos mais recentes das coleções e os ranqueia conforme
+    o `ranqueamento`:
+    - semantico: similaridade de embeddings com a pergunta (padrão)
+    - lexico: fração dos termos da pergunta presentes no log
+    - hibrido: combinação ponderada dos scores semântico e léxico
+    - recencia: apenas os mais recentes, sem embeddings
+    Se `desde` for informado, lê apenas documentos com timestamp
+    posterior (busca incremental).
+    Com `deadline`, degrada conforme o orçamento restante:
+    - pool_reduzido: lê só `limite` documentos por coleção (em vez de 3×)
+    - recencia: dispensa o ranqueamento semântico e ordena por data
+    `pergunta_embedding` pré-calculado deve vir acompanhado do `backend` que o gerou.
+    Retorna a lista de candidatos ordenada por relevância e o maior
+    timestamp lido (ponto de partida do próximo turno incremental).
+    """
+    if ranqueamento not in RANQUEAMENTOS:
+        raise ValueError(f"Ranqueamento inválido: {ranqueamento}")
+
     db = get_firestore_client()
-    pergunta_lower = pergunta.lower()
-
-    # 🔎 Mapeamento expandido (mantido do seu código atual)
-    colecao_map = {
-        "vida nova": "vida_nova_logs",
-        "vida": "vida_nova_logs",
-        "nova": "vida_nova_logs",
-        "auditoria": "controle_auditoria_logs",
-        "controle": "controle_auditoria_logs",
-        "orcamento": "orcamento_contratacao_logs",
-        "contratacao": "orcamento_contratacao_logs",
-        "contratação": "orcamento_contratacao_logs",
-        "viagem": "viagem_transmissao_logs",
-        "transmissao": "viagem_transmissao_logs",
-        "transmissão": "viagem_transmissao_logs",
-        "erro": "controle_auditoria_logs",
-        "falha": "controle_auditoria_logs",
-        "api": "orcamento_contratacao_logs",
-        "sistema": "vida_nova_logs",
-        "serviço": "orcamento_contratacao_logs",
-        "microserviço": "orcamento_contratacao_logs",
-        "plataforma": "viagem_transmissao_logs",
-    }
-
-    # 🔍 Identifica qual coleção é mais provável
-    colecao = None
-    for termo, nome_colecao in colecao_map.items():
-        if termo in pergunta_lower:
-            colecao = nome_colecao
-            break
-
-    # 🔁 fallback multi-coleção
-    if not colecao:
-        print("⚠️ Nenhum termo específico encontrado, aplicando fallback multi-coleção.")
-        colecoes = [
-            "vida_nova_logs",
-            "controle_auditoria_logs",
-            "orcamento_contratacao_logs",
-            "viagem_transmissao_logs",
-        ]
-    else:
-        colecoes = [colecao]
+    snapshot = snapshot_atual()
 
-    # ==============================================================
-    # 🧠 Gera embedding da pergunta
-    # ==============================================================
-    pergunta_embedding = generate_embedding(pergunta)
-    if not pergunta_embedding:
-        print("⚠️ Não foi possível gerar embedding da pergunta.")
-        return "Não foi possível gerar embedding da pergunta."
+    # ⏱️ Tamanho do pool de candidatos conforme a estratégia e o orçamento
+    fator_pool = 1 if ranqueamento == "recencia" else 3  # lê mais registros para ranquear
+    if fator_pool > 1 and deadline and deadline.orcamento_recuperacao() < LIMIAR_POOL_REDUZIDO_SEGUNDOS:
+        deadline.degradar("pool_reduzido", "orçamento curto para o pool completo de candidatos")
+        fator_pool = 1
 
-    # ==============================================================
-    # 📥 Leitura e ranqueamento semântico dos documentos
-    # ==============================================================
-    candidatos = []
+    semantico = ranqueamento in ("semantico", "hibrido") and not (deadline and deadline.modo == "recencia")
+    if semantico and deadline and deadline.orcamento_recuperacao() < LIMIAR_RECENCIA_SEGUNDOS:
+        deadline.degradar("recencia", "orçamento insuficiente para ranqueamento semântico")
+        semantico = False
+
+    lidos = {}
+    exatos = {}  # vetores float32 à mão nesta leitura (reavaliação da lista curta)
+    no_snapshot = set()
+    ultimo_timestamp = desde
     for col in colecoes:
         try:
             print(f"📂 Buscando contexto em Firestore: coleção '{col}'")
+            query = db.collection(col)
+            if desde is not None:
+                query = query.where("timestamp", ">", desde)
+            timeout = max(deadline.orcamento_recuperacao(), 0.5) if deadline else None
             docs = (
-                db.collection(col)
+                query
                 .order_by("timestamp", direction=firestore.Query.DESCENDING)
-                .limit(limite * 3)  # lê mais registros para ranquear
-                .stream()
+                .limit(limite * fator_pool)
+                .stream(timeout=timeout)
             )
 
             for doc in docs:
                 data = doc.to_dict()
-                texto_log = " ".join([str(v) for v in data.values() if isinstance(v, str)])
-                texto_log = sanitize_text(texto_log)
+                registro_colecoes.observar(col, data.get("timestamp"))
+                ultimo_timestamp = maior_timestamp(ultimo_timestamp, data.get("timestamp"))
+                chave = f"{col}/{doc.id}"
+
+                # 🧊 Documentos do snapshot compartilhado já têm texto sanitizado
+                texto_log = snapshot.texto(chave) if snapshot else None
+                if texto_log is None:
+                    texto_log = extrair_texto_log(data)
                 if not texto_log:
                     continue
 
-                # Gera embedding do log (modo leve)
-                emb_log = generate_embedding(texto_log[:500])
-                if not emb_log:
+                lidos[chave] = {
+                    "doc_id": doc.id,
+                    "colecao": col,
+                    "texto": texto_log,
+                    "timestamp": data.get("timestamp"),
+                }
+                if not semantico:
                     continue
 
-                score = cosine_similarity(pergunta_embedding, emb_log)
-                candidatos.append((score, col, texto_log))
+                # 🧠 Embedding da pergunta só é gerado se houver documento a ranquear
+                if pergunta_embedding is None:
+                    backend, pergunta_embedding = embedding_pergunta(pergunta, deadline)
+                if not len(pergunta_embedding):
+                    if deadline is None:
+                        print("⚠️ Não foi possível gerar embedding da pergunta.")
+                        return [], desde
+                    deadline.degradar("recencia", "embedding da pergunta indisponível no prazo")
+                    semantico = False
+                    continue
+
+                # Embedding do log: snapshot compartilhado, store compacto do processo
+                # ou geração sob demanda (modo leve)
+                store = obter_store(len(pergunta_embedding), backend.nome)
+                if (snapshot and snapshot.backend == backend.nome
+                        and snapshot.dimensoes == store.dimensoes and snapshot.contem(chave)):
+                    no_snapshot.add(chave)
+                    emb_log = embedding_precalculado(data, backend)
+                    if emb_log is not None:
+                        exatos[chave] = emb_log
+                else:
+                    # Documentos ingeridos pelo /logs/ingest já trazem o vetor pronto
+                    emb_log = embedding_precalculado(data, backend)
+                    if emb_log is not None:
+                        exatos[chave] = emb_log
+                    if store.contem(chave):
+                        continue
+                    if emb_log is None:
+                        if deadline and deadline.orcamento_recuperacao() < LIMIAR_RECENCIA_SEGUNDOS:
+                            deadline.degradar("recencia", "prazo esgotado durante os embeddings dos logs")
+                            semantico = False
+                            continue
+                        emb_log = backend.gerar(
+                            texto_log[:LIMITE_TEXTO_EMBEDDING],
+                            timeout=deadline.orcamento_recuperacao() if deadline else None,
+                        )
+                    if emb_log is None or len(emb_log) != store.dimensoes:
+                        del lidos[chave]
+                        continue
+                    store.adicionar(chave, emb_log)
+                    exatos[chave] = emb_log
         except Exception as e:
             print(f"⚠️ Erro ao ler coleção {col}: {e}")
 
+    if not lidos:
+        return [], ultimo_timestamp
+
+    # 🔤 Ranqueamento léxico: sem embeddings, empates resolvidos pela recência
+    if ranqueamento == "lexico":
+        termos = set(normalizar_termos(pergunta))
+        recentes = ordenar_por_recencia(lidos.values())
+        candidatos = sorted((dict(c, score=pontuar(termos, c["texto"])) for c in recentes),
+                            key=lambda c: c["score"], reverse=True)
+        return candidatos[:limite], ultimo_timestamp
+
+    # 🕒 Estratégia de recência ou modo degradado (como o caminho legado `limit_to_last`)
+    if not semantico:
+        candidatos = [dict(c, score=0.0) for c in ordenar_por_recencia(lidos.values())]
+        return candidatos[:limite], ultimo_timestamp
+
+    # 🔢 Ordena por relevância (lista curta reavaliada em precisão total)
+    # No híbrido, todos os lidos recebem score semântico para a combinação
+    def vetores_exatos(chaves: list) -> dict:
+        # Lidos agora (campo `embedding` ou recém-gerados) ou já no cache de embeddings
+        vetores = {}
+        for chave in chaves:
+            vetor = exatos.get(chave)
+            if vetor is None:
+                vetor = backend.em_cache(lidos[chave]["texto"][:LIMITE_TEXTO_EMBEDDING])
+            if vetor is not None:
+                vetores[chave] = vetor
+        return vetores
+
+    k = limite if ranqueamento == "semantico" else len(lidos)
+    ranqueados = obter_store(len(pergunta_embedding), backend.nome).buscar(
+        pergunta_embedding, k=k, chaves=[c for c in lidos if c not in no_snapshot],
+        vetores_exatos=vetores_exatos,
+    )
+    if no_snapshot:
+        ranqueados += snapshot.buscar(pergunta_embedding, k=k, chaves=list(no_snapshot),
+                                      vetores_exatos=vetores_exatos)
+        ranqueados = sorted(ranqueados, key=lambda r: r[1], reverse=True)[:k]
+
+    if ranqueamento == "hibrido":
+        termos = set(normalizar_termos(pergunta))
+        ranqueados = sorted(
+            ((chave, PESO_SEMANTICO_HIBRIDO * score
+              + (1 - PESO_SEMANTICO_HIBRIDO) * pontuar(termos, lidos[chave]["texto"]))
+             for chave, score in ranqueados),
+            key=lambda r: r[1], reverse=True,
+        )[:limite]
+
+    candidatos = [dict(lidos[chave], score=score) for chave, score in ranqueados]
+    return candidatos, ultimo_timestamp
+
+
+def atualizar_candidatos(pergunta: str, candidatos_anteriores: list, colecoes: list,
+                         desde, limite: int = 10, deadline: Deadline = None,
+                         ranqueamento: str = "semantico") -> list:
+    """
+    Reaproveita os candidatos de um turno anterior e acrescenta apenas
+    os documentos novos desde `desde`. Documentos já conhecidos não são
+    relidos nem têm embedding recalculado.
+    `pergunta` deve ser a pergunta âncora da sessão: os novos documentos
+    são pontuados contra ela para que os scores sejam comparáveis com os
+    dos candidatos anteriores na mesclagem.
+    Retorna os candidatos mesclados e o novo timestamp de referência.
+    """
+    novos, ultimo_timestamp = buscar_candidatos(pergunta, colecoes, limite=limite, desde=desde,
+                                                deadline=deadline, ranqueamento=ranqueamento)
+
+    conhecidos = {(c["colecao"], c["doc_id"]) for c in candidatos_anteriores}
+    novos = [c for c in novos if (c["colecao"], c["doc_id"]) not in conhecidos]
+    if not novos:
+        print("♻️ Nenhum documento novo desde o último turno; contexto da sessão reaproveitado.")
+        return list(candidatos_anteriores), ultimo_timestamp
+
+    if ranqueamento == "recencia" or (deadline and deadline.modo == "recencia"):
+        # Sem embeddings no prazo: novos documentos entram primeiro (mais recentes)
+        mesclados = novos + candidatos_anteriores
+    else:
+        mesclados = sorted(candidatos_anteriores + novos, key=lambda c: c["score"], reverse=True)
+    print(f"♻️ Contexto da sessão atualizado com {len(novos)} documentos novos.")
+    return mesclados[:limite], ultimo_timestamp
+
+
+# --------------------------------------------------------------
+# 🔍 Função principal
+# --------------------------------------------------------------
+def obter_contexto_firestone(pergunta: str, limite: int = 10) -> str:
+    """
+    Busca documentos no Firestore relacionados ao tema da pergunta.
+    Utiliza embeddings para ranquear semanticamente os logs.
+    Retorna um resumo textual consolidado para o modelo OpenAI.
+    """
+    colecoes = selecionar_colecoes(pergunta)
+
+    backend, pergunta_embedding = embedding_pergunta(pergunta)
+    if backend is None:
+        print("⚠️ Não foi possível gerar embedding da pergunta.")
+        return "Não foi possível gerar embedding da pergunta."
+
+    candidatos, _ = buscar_candidatos(pergunta, colecoes, limite=limite,
+                                      pergunta_embedding=pergunta_embedding, backend=backend)
+
     if not candidatos:
         return "Nenhum log relevante foi encontrado nas coleções disponíveis."
 
-    # 🔢 Ordena por relevância
-    candidatos.sort(key=lambda x: x[0], reverse=True)
-    top = candidatos[:limite]
-
-    # 🔗 Monta o contexto final consolidado
-    contexto = [f"[{col}] {texto}" for _, col, texto in top]
-    contexto_final = "\n".join(contexto)
-    print(f"✅ Contexto coletado e ranqueado: {len(top)} registros de {len(colecoes)} coleções")
-    return contexto_final[:6000]
+    print(f"✅ Contexto coletado e ranqueado: {len(candidatos)} registros de {len(colecoes)} coleções")
+    return formatar_contexto(candidatos)
@@ -8,10 +8,18 @@
 # ==============================================================
 
 import os
+import json
+import time
 from dotenv import load_dotenv
 from openai import OpenAI
 from app.utils.validation import is_prompt_valid
-from app.services.firestore_context import obter_contexto_firestone
+from app.services.aggregates import agregados
+from app.services.firestore_context import formatar_contexto, selecionar_colecoes
+from app.services.prompt_templates import obter_template
+from app.services.retrieval_strategies import EstrategiaRecuperacao, obter_estrategia, recuperar
+from app.services.session_store import SessaoChat, sessoes
+from app.services.usage_metrics import registrar_uso
+from app.utils.deadline import Deadline, LIMIAR_AGREGADOS_SEGUNDOS
 from app.utils.sanitize import sanitize_text
 
 load_dotenv()
@@ -34,20 +42,27 @@ except Exception as e:
 # 🧮 Função de geração de Embeddings
 # ==============================================================
 
-def generate_embedding(texto: str) -> list:
+# Dimensão reduzida opcional (ex.: 512) suportada pelo `text-embedding-3-small`
+EMBEDDING_DIMENSOES = int(os.getenv("EMBEDDING_DIMENSOES", "0")) or None
+
+def generate_embedding(texto: str, timeout: float = None) -> list:
     """
     Gera o embedding semântico de um texto (log, pergunta ou contexto).
     Usa o modelo `text-embedding-3-small` para custo otimizado.
     Retorna uma lista de floats representando o vetor semântico.
+    Com `timeout`, a chamada é feita sem novas tentativas e limitada ao prazo.
     """
     if not texto or not isinstance(texto, str):
         print("⚠️ [OpenAI] Texto inválido para geração de embedding.")
         return []
 
     try:
-        response = client.embeddings.create(
+        parametros = {"dimensions": EMBEDDING_DIMENSOES} if EMBEDDING_DIMENSOES else {}
+        cliente = client.with_options(timeout=timeout, max_retries=0) if timeout else client
+        response = cliente.embeddings.create(
             model="text-embedding-3-small",
-            input=texto
+            input=texto,
+            **parametros,
         )
         embedding = response.data[0].embedding
         print(f"✅ [OpenAI] Embedding gerado ({len(embedding)} dimensões).")
@@ -56,6 +71,36 @@ def generate_embedding(texto: str) -> list:
         print(f"❌ [OpenAI] Erro ao gerar embedding: {e}")
         return []
 
+
+TAMANHO_LOTE_EMBEDDINGS = 256
+
+def generate_embeddings_lote(textos: list, timeout: float = None) -> list:
+    """
+    Gera embeddings de vários textos com uma chamada por bloco de até
+    TAMANHO_LOTE_EMBEDDINGS entradas (a API aceita lista em `input`).
+    Retorna os vetores na ordem da entrada; [] nas posições que falharem.
+    """
+    resultado = [[] for _ in textos]
+    validos = [i for i, t in enumerate(textos) if t and isinstance(t, str)]
+    parametros = {"dimensions": EMBEDDING_DIMENSOES} if EMBEDDING_DIMENSOES else {}
+    cliente = client.with_options(timeout=timeout) if timeout else client
+
+    for inicio in range(0, len(validos), TAMANHO_LOTE_EMBEDDINGS):
+        bloco = validos[inicio:inicio + TAMANHO_LOTE_EMBEDDINGS]
+        try:
+            response = cliente.embeddings.create(
+                model="text-embedding-3-small",
+                input=[textos[i] for i in bloco],
+                **parametros,
+            )
+            for item in response.data:
+                resultado[bloco[item.index]] = item.embedding
+        except Exception as e:
+            print(f"❌ [OpenAI] Erro ao gerar lote de {len(bloco)} embeddings: {e}")
+
+    print(f"✅ [OpenAI] Lote de embeddings gerado ({sum(1 for r in resultado if r)}/{len(textos)}).")
+    return resultado
+
 # ==============================================================
 # 🧩 Função auxiliar: sumarização local
 # ==============================================================
@@ -87,121 +132,165 @@ def resumir_contexto_local(contexto: str, limite: int = 3000) -> str:
 
 
 # ==============================================================
-# 🧠 Função principal: gerar resposta com perfis automáticos
+# 🧭 Perfis de usuário
 # ==============================================================
 
-def gerar_resposta(pergunta: str) -> str:
+def detectar_perfil(pergunta: str):
     """
-    Gera resposta adaptada ao perfil do usuário:
-    - Gestor/Diretor → visão gerencial e estratégica
-    - Analista de Sustentação/SRE → visão operacional
-    - Desenvolvedor → visão de engenharia de software
-    - Técnico (default) → visão técnica genérica
+    Detecta o perfil do usuário pela pergunta (gerencial, sustentação, engenharia).
+    Retorna None quando nenhum termo de perfil aparece (perfil técnico padrão).
     """
-
-    # 🛡️ 1. Validação semântica
-    if not is_prompt_valid(pergunta):
-        return (
-            "🚫 Sua pergunta parece fora do contexto técnico. "
-            "Por favor, pergunte algo relacionado a logs, falhas, "
-            "monitoramento, sistemas corporativos ou incidentes."
-        )
-
-    if len(pergunta) > 1000:
-        return "⚠️ A pergunta é muito longa. Resuma o problema e tente novamente."
-
-    # 🧭 2. Detecção de perfil do usuário (gerencial, sustentação, engenharia, técnico)
     pergunta_lower = pergunta.lower()
 
     if any(p in pergunta_lower for p in [
         "gestor", "diretor", "gerente", "saúde técnica", "status",
         "resumo geral", "panorama", "visão executiva", "indicadores"
     ]):
-        estilo_usuario = "gerencial"
-        estilo_instrucao = (
-            "Adote uma linguagem gerencial e analítica, "
-            "fornecendo uma visão executiva da saúde técnica dos sistemas. "
-            "Evite jargões de código e foque em indicadores, riscos, tendências "
-            "e recomendações estratégicas para decisão."
-        )
+        return "gerencial"
 
-    elif any(p in pergunta_lower for p in [
+    if any(p in pergunta_lower for p in [
         "analista", "sustentação", "suporte", "infraestrutura", "técnico", "sre"
     ]):
-        estilo_usuario = "sustentação"
-        estilo_instrucao = (
-            "Adote uma linguagem técnica operacional, "
-            "focando em logs, sintomas, causas prováveis e etapas de mitigação. "
-            "Forneça instruções práticas para diagnóstico e correção, "
-            "sem se aprofundar em código-fonte."
-        )
+        return "sustentação"
 
-    elif any(p in pergunta_lower for p in [
+    if any(p in pergunta_lower for p in [
         "dev", "programador", "engenheiro", "desenvolvedor", "pleno", "sênior"
     ]):
-        estilo_usuario = "engenharia"
-        estilo_instrucao = (
-            "Adote uma linguagem técnica avançada voltada a desenvolvedores, "
-            "incluindo detalhes sobre classes, APIs, dependências, arquitetura e performance. "
-            "Forneça insights sobre padrões de projeto, refatoração e boas práticas de código."
-        )
+        return "engenharia"
 
-    else:
-        estilo_usuario = "técnico"
-        estilo_instrucao = (
-            "Adote uma linguagem técnica e detalhada, "
-            "analisando causas, sintomas, logs e possíveis soluções operacionais. "
-            "Inclua recomendações práticas e diagnósticos específicos."
-        )
+    return None
 
-    print(f"🧩 Modo de resposta: {estilo_usuario.upper()}")
 
-    # 🔍 3. Buscar contexto técnico real do Firestore
-    try:
-        contexto_logs = obter_contexto_firestone(pergunta)
-    except Exception as e:
-        print(f"⚠️ [Firestore] Erro ao obter contexto: {e}")
-        contexto_logs = "Não foi possível recuperar o contexto técnico neste momento."
+# ==============================================================
+# 🔍 Contexto da sessão (busca completa ou incremental)
+# ==============================================================
+
+def obter_contexto_sessao(pergunta: str, sessao: SessaoChat, deadline: Deadline = None,
+                          estrategia: EstrategiaRecuperacao = None) -> str:
+    """
+    Obtém o contexto técnico para o turno atual com a estratégia de recuperação escolhida.
+    - Primeiro turno: busca e ranqueamento completos no Firestore.
+    - Turnos seguintes: reaproveita os documentos da sessão e busca
+      apenas os documentos novos desde o último turno, pontuados contra
+      a pergunta âncora (a mesma que ranqueou os documentos anteriores).
+    """
+    estrategia = estrategia or obter_estrategia()
+    if not sessao.candidatos:
+        sessao.colecoes = selecionar_colecoes(pergunta)
+        sessao.pergunta_ancora = pergunta
+
+    candidatos, ultimo_timestamp = recuperar(
+        estrategia, sessao.pergunta_ancora or pergunta, sessao.colecoes, candidatos_anteriores=sessao.candidatos,
+        desde=sessao.ultimo_timestamp, deadline=deadline,
+    )
+
+    sessao.candidatos = candidatos
+    sessao.ultimo_timestamp = ultimo_timestamp
+
+    if not candidatos:
+        return "Nenhum log relevante foi encontrado nas coleções disponíveis."
 
-    # 🧩 4. Reduzir o contexto localmente para otimizar custo e foco
-    contexto_resumido = resumir_contexto_local(contexto_logs)
+    print(f"✅ Contexto da sessão: {len(candidatos)} registros de {len(sessao.colecoes)} coleções")
+    return formatar_contexto(candidatos)
 
-    # 🧱 5. Montar o prompt adaptado
-    prompt = f"""
-    Você é um assistente especializado em sustentação e engenharia de sistemas corporativos.
-    {estilo_instrucao}
 
-    🔹 CONTEXTO FIRESTORE (resumido):
-    {contexto_resumido}
+# ==============================================================
+# 🧠 Função principal: gerar resposta com perfis automáticos
+# ==============================================================
 
-    🔹 PERGUNTA:
-    {pergunta}
+def gerar_resposta(pergunta: str, session_id: str = None, deadline: Deadline = None,
+                   estrategia: str = None) -> str:
+    """
+    Gera resposta adaptada ao perfil do usuário:
+    - Gestor/Diretor → visão gerencial e estratégica
+    - Analista de Sustentação/SRE → visão operacional
+    - Desenvolvedor → visão de engenharia de software
+    - Técnico (default) → visão técnica genérica
 
-    Responda de acordo com o estilo acima.
+    Com `session_id`, perguntas de acompanhamento reutilizam o contexto
+    e o histórico resumido dos turnos anteriores da mesma sessão.
+    O `deadline` limita a latência total; o modo de degradação usado
+    fica registrado em `deadline.modo`.
+    `estrategia` força a estratégia de recuperação (senão vale a do perfil
+    ou a padrão da implantação).
     """
+    deadline = deadline or Deadline()
+    sessao = sessoes.obter(session_id) if session_id else None
+    acompanhamento = bool(sessao and sessao.candidatos)
+
+    # 🛡️ 1. Validação semântica (perguntas de acompanhamento herdam o tema da sessão)
+    if not is_prompt_valid(pergunta, acompanhamento=acompanhamento):
+        return (
+            "🚫 Sua pergunta parece fora do contexto técnico. "
+            "Por favor, pergunte algo relacionado a logs, falhas, "
+            "monitoramento, sistemas corporativos ou incidentes."
+        )
+
+    if len(pergunta) > 1000:
+        return "⚠️ A pergunta é muito longa. Resuma o problema e tente novamente."
+
+    if sessao is None:
+        sessao = SessaoChat(session_id=session_id or "")
+
+    # 🧭 2. Detecção de perfil do usuário (gerencial, sustentação, engenharia, técnico)
+    estilo_usuario = detectar_perfil(pergunta) or sessao.estilo_usuario or "técnico"
+    template = obter_template(estilo_usuario)
+    sessao.estilo_usuario = estilo_usuario
+    estrategia_recuperacao = obter_estrategia(estrategia, estilo_usuario)
+
+    print(f"🧩 Modo de resposta: {estilo_usuario.upper()}"
+          + (f" (sessão, turno {sessao.turnos + 1})" if acompanhamento else ""))
+
+    # 🔍 3. Buscar contexto técnico real do Firestore (ou só agregados, se o prazo não permitir)
+    if deadline.orcamento_recuperacao() < LIMIAR_AGREGADOS_SEGUNDOS:
+        deadline.degradar("agregados", "sem orçamento para consultar o Firestore")
+        contexto_resumido = "Contexto detalhado omitido: prazo da requisição esgotado."
+    else:
+        try:
+            contexto_logs = obter_contexto_sessao(pergunta, sessao, deadline, estrategia_recuperacao)
+        except Exception as e:
+            print(f"⚠️ [Firestore] Erro ao obter contexto: {e}")
+            contexto_logs = "Não foi possível recuperar o contexto técnico neste momento."
+
+        # 🧩 4. Reduzir o contexto localmente para otimizar custo e foco
+        contexto_resumido = resumir_contexto_local(contexto_logs)
+
+    # 📊 Perguntas gerenciais (ou modo agregados) recebem os indicadores de todas as coleções
+    #    (sincronizados em background: a leitura da tabela não consome o prazo)
+    indicadores = ""
+    if estilo_usuario == "gerencial" or deadline.modo == "agregados":
+        indicadores = agregados.tabela()
+
+    # 🧱 5. Montar o prompt a partir do template do perfil
+    #    (prefixo estático primeiro, partes dinâmicas por último)
+    messages = template.montar_mensagens(
+        pergunta, contexto_resumido, indicadores=indicadores, historico=sessao.resumo
+    )
 
     # 🤖 6. Geração da resposta via OpenAI
     try:
-        response = client.chat.completions.create(
+        inicio = time.perf_counter()
+        # Sem novas tentativas: uma única chamada limitada ao prazo restante
+        # (latência máxima ≈ deadline, ou 1 s além dele se o prazo já estiver no fim)
+        cliente = client.with_options(timeout=max(deadline.restante(), 1.0), max_retries=0)
+        response = cliente.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "Você é um assistente técnico e gerencial de sustentação de sistemas. "
-                        "Seu objetivo é transformar logs e métricas em insights claros e úteis. "
-                        "Respeite o estilo pedido no prompt: "
-                        "gerencial (executivo), sustentação (operacional), engenharia (dev) ou técnico (padrão)."
-                    ),
-                },
-                {"role": "user", "content": prompt},
-            ],
+            messages=messages,
             temperature=0.35,
             max_tokens=900,
         )
 
         resposta = response.choices[0].message.content.strip()
+        uso = registrar_uso(template.template_id, response.usage, time.perf_counter() - inicio)
         print(f"✅ [OpenAI] Resposta gerada com sucesso ({len(resposta)} caracteres).")
+        print(json.dumps({"evento": "uso_tokens", "tokens_prefixo": template.tokens_prefixo, **uso},
+                         ensure_ascii=False))
+
+        # 🗂️ 7. Atualiza a sessão para os próximos turnos
+        if session_id:
+            sessao.registrar_turno(pergunta, resposta)
+            sessoes.salvar(sessao)
+
         return resposta
 
     except Exception as e:
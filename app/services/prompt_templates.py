@@ -0,0 +1,134 @@
+# ==============================================================
+# 🧱 app/services/prompt_templates.py
+# --------------------------------------------------------------
+# Registro de templates de prompt versionados, um por perfil.
+# Cada template separa um prefixo estático (mensagem de sistema
+# + instruções do perfil) das partes dinâmicas (indicadores,
+# contexto, histórico e pergunta), que vão sempre no final.
+# Assim, requisições do mesmo perfil compartilham exatamente o
+# mesmo prefixo, aproveitando o cache de prompt do provedor.
+# ==============================================================
+
+import re
+from dataclasses import dataclass, field
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # sem tiktoken (ou sem o arquivo de encoding): contagem estimada
+    _encoding = None
+
+CONTAGEM_TOKENS = "tiktoken" if _encoding is not None else "estimativa"
+
+# Tamanho mínimo de prefixo para o cache automático da OpenAI
+MIN_TOKENS_CACHE = 1024
+
+
+# ==============================================================
+# 🔧 Funções auxiliares
+# ==============================================================
+
+def normalizar_espacos(texto: str) -> str:
+    """Remove indentação e espaços repetidos, preservando quebras de linha."""
+    linhas = [re.sub(r"[ \t]+", " ", linha).strip() for linha in (texto or "").split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(linhas)).strip()
+
+
+def contar_tokens(texto: str) -> int:
+    """Conta tokens com tiktoken (se instalado) ou estima ~4 caracteres por token."""
+    if _encoding is not None:
+        return len(_encoding.encode(texto))
+    return max(1, len(texto) // 4)
+
+
+# ==============================================================
+# 📄 Template
+# ==============================================================
+
+SISTEMA_BASE = (
+    "Você é um assistente técnico e gerencial de sustentação de sistemas corporativos. "
+    "Seu objetivo é transformar logs e métricas em insights claros e úteis. "
+    "Responda sempre com base nos dados do Firestore fornecidos e evite generalizações. "
+    "Se possível, cite a origem dos logs (ex: [vida_nova_logs], [controle_auditoria_logs])."
+)
+
+
+@dataclass(frozen=True)
+class TemplatePrompt:
+    perfil: str
+    versao: int
+    instrucao: str
+    prefixo: str = field(init=False)
+    tokens_prefixo: int = field(init=False)
+
+    def __post_init__(self):
+        prefixo = normalizar_espacos(
+            f"{SISTEMA_BASE}\n\n"
+            f"Perfil da resposta: {self.perfil}.\n"
+            f"{self.instrucao}\n\n"
+            "A mensagem do usuário traz, nesta ordem: indicadores agregados (quando houver), "
+            "contexto do Firestore (resumido), histórico da conversa (quando houver) e a pergunta. "
+            "Responda de acordo com o estilo acima."
+        )
+        object.__setattr__(self, "prefixo", prefixo)
+        object.__setattr__(self, "tokens_prefixo", contar_tokens(prefixo))
+
+    @property
+    def template_id(self) -> str:
+        return f"{self.perfil}-v{self.versao}"
+
+    @property
+    def elegivel_cache(self) -> bool:
+        """Indica se o prefixo atinge o tamanho mínimo do cache de prompt do provedor."""
+        return self.tokens_prefixo >= MIN_TOKENS_CACHE
+
+    def montar_mensagens(self, pergunta: str, contexto: str,
+                         indicadores: str = "", historico: str = "") -> list:
+        """Monta as mensagens: prefixo estático primeiro, partes dinâmicas por último."""
+        partes = []
+        if indicadores:
+            partes.append(f"🔹 INDICADORES AGREGADOS (logs sincronizados por coleção na janela recente; cobertura parcial = janela ainda em leitura):\n{indicadores}")
+        partes.append(f"🔹 CONTEXTO FIRESTORE (resumido):\n{contexto}")
+        if historico:
+            partes.append(f"🔹 HISTÓRICO DA CONVERSA (resumido):\n{historico}")
+        partes.append(f"🔹 PERGUNTA:\n{pergunta}")
+
+        return [
+            {"role": "system", "content": self.prefixo},
+            {"role": "user", "content": normalizar_espacos("\n\n".join(partes))},
+        ]
+
+
+# ==============================================================
+# 🗂️ Registro por perfil
+# ==============================================================
+
+TEMPLATES = {
+    "gerencial": TemplatePrompt("gerencial", 1, (
+        "Adote uma linguagem gerencial e analítica, "
+        "fornecendo uma visão executiva da saúde técnica dos sistemas. "
+        "Evite jargões de código e foque em indicadores, riscos, tendências "
+        "e recomendações estratégicas para decisão."
+    )),
+    "sustentação": TemplatePrompt("sustentação", 1, (
+        "Adote uma linguagem técnica operacional, "
+        "focando em logs, sintomas, causas prováveis e etapas de mitigação. "
+        "Forneça instruções práticas para diagnóstico e correção, "
+        "sem se aprofundar em código-fonte."
+    )),
+    "engenharia": TemplatePrompt("engenharia", 1, (
+        "Adote uma linguagem técnica avançada voltada a desenvolvedores, "
+        "incluindo detalhes sobre classes, APIs, dependências, arquitetura e performance. "
+        "Forneça insights sobre padrões de projeto, refatoração e boas práticas de código."
+    )),
+    "técnico": TemplatePrompt("técnico", 1, (
+        "Adote uma linguagem técnica e detalhada, "
+        "analisando causas, sintomas, logs e possíveis soluções operacionais. "
+        "Inclua recomendações práticas e diagnósticos específicos."
+    )),
+}
+
+
+def obter_template(perfil: str) -> TemplatePrompt:
+    """Retorna o template do perfil (ou o técnico, padrão)."""
+    return TEMPLATES.get(perfil, TEMPLATES["técnico"])
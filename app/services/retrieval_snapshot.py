@@ -0,0 +1,378 @@
+# ==============================================================
+# 🧊 app/services/retrieval_snapshot.py
+# --------------------------------------------------------------
+# Snapshot de recuperação somente leitura, compartilhado entre
+# processos via mmap.
+# - O construtor grava embeddings (int8 + escala), metadados e
+#   textos sanitizados em um arquivo versionado e publica a nova
+#   versão de forma atômica (arquivo CURRENT).
+# - Cada worker do uvicorn mapeia o arquivo em memória (as páginas
+#   são compartilhadas pelo sistema operacional) e troca para a
+#   nova versão assim que ela aparece.
+#
+# Construção: python -m app.services.retrieval_snapshot [--intervalo 300]
+# ==============================================================
+
+import os
+import sys
+import json
+import mmap
+import time
+import argparse
+import threading
+import numpy as np
+from app.utils.embedding_store import FATOR_LISTA_CURTA, normalizar, quantizar_int8
+
+# ==============================================================
+# ⚙️ Configuração
+# ==============================================================
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "/tmp/retrieval_snapshot")
+INTERVALO_VERIFICACAO = float(os.getenv("SNAPSHOT_VERIFICACAO_SEGUNDOS", "10"))
+VERSOES_MANTIDAS = 3
+MAGIC = b"ALSNAP01"
+ALINHAMENTO = 64
+
+
+def _alinhar(posicao: int) -> int:
+    return (posicao + ALINHAMENTO - 1) // ALINHAMENTO * ALINHAMENTO
+
+
+# ==============================================================
+# 🏗️ Construção do snapshot
+# ==============================================================
+
+def gravar_snapshot(registros: list, dimensoes: int, diretorio: str = SNAPSHOT_DIR,
+                    backend: str = "openai-3-small-1536") -> str:
+    """
+    Grava um novo snapshot versionado e o publica atomicamente.
+    `registros`: lista de dicts com colecao, doc_id, texto, timestamp e embedding.
+    Retorna o caminho do arquivo publicado.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    versao = time.time_ns()
+    nome = f"snapshot-{versao}.bin"
+
+    matriz = normalizar([r["embedding"] for r in registros]) if registros else \
+        np.zeros((0, dimensoes), dtype=np.float32)
+    codigos, escalas = quantizar_int8(matriz)
+
+    textos = [r["texto"].encode("utf-8") for r in registros]
+    offsets_texto = np.zeros(len(textos) + 1, dtype=np.uint64)
+    offsets_texto[1:] = np.cumsum([len(t) for t in textos], dtype=np.uint64)
+    metadados = json.dumps(
+        [[r["colecao"], r["doc_id"], str(r.get("timestamp") or "")] for r in registros],
+        ensure_ascii=False,
+    ).encode("utf-8")
+
+    secoes = [
+        ("codigos", codigos.tobytes()),
+        ("escalas", escalas.tobytes()),
+        ("offsets_texto", offsets_texto.tobytes()),
+        ("textos", b"".join(textos)),
+        ("metadados", metadados),
+    ]
+
+    # Cabeçalho com reserva fixa para que os offsets sejam conhecidos antes da escrita
+    cabecalho = {
+        "versao": versao,
+        "dimensoes": dimensoes,
+        "total": len(registros),
+        "backend": backend,
+        "modo": "int8",
+        "secoes": {},
+    }
+    inicio_dados = _alinhar(len(MAGIC) + 4 + 4096)
+    posicao = inicio_dados
+    for nome_secao, dados in secoes:
+        cabecalho["secoes"][nome_secao] = [posicao, len(dados)]
+        posicao = _alinhar(posicao + len(dados))
+
+    cabecalho_bytes = json.dumps(cabecalho).encode("utf-8")
+    if len(cabecalho_bytes) > 4096:
+        raise ValueError("Cabeçalho do snapshot excede o espaço reservado.")
+
+    caminho = os.path.join(diretorio, nome)
+    temporario = caminho + ".tmp"
+    with open(temporario, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(cabecalho_bytes).to_bytes(4, "little"))
+        f.write(cabecalho_bytes)
+        for nome_secao, dados in secoes:
+            f.seek(cabecalho["secoes"][nome_secao][0])
+            f.write(dados)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+
+    # 🔁 Publicação atômica da nova versão
+    ponteiro = os.path.join(diretorio, "CURRENT")
+    with open(ponteiro + ".tmp", "w") as f:
+        f.write(nome)
+    os.replace(ponteiro + ".tmp", ponteiro)
+
+    _remover_versoes_antigas(diretorio, nome)
+    print(f"🧊 [Snapshot] Versão {versao} publicada ({len(registros)} documentos, "
+          f"{os.path.getsize(caminho) / 1024 / 1024:.1f} MB).")
+    return caminho
+
+
+def _remover_versoes_antigas(diretorio: str, atual: str):
+    """Mantém apenas as últimas versões (workers podem ainda estar usando as anteriores)."""
+    versoes = sorted(n for n in os.listdir(diretorio) if n.startswith("snapshot-") and n.endswith(".bin"))
+    for nome in versoes[:-VERSOES_MANTIDAS]:
+        if nome != atual:
+            try:
+                os.remove(os.path.join(diretorio, nome))
+            except OSError:
+                pass
+
+
+def construir_snapshot(colecoes: list, limite_por_colecao: int = 2000,
+                       diretorio: str = SNAPSHOT_DIR) -> str:
+    """
+    Lê os documentos mais recentes do Firestore, gera embeddings e grava o snapshot.
+    Na primeira construção, ajusta e publica o IDF do backend local com os
+    textos lidos (os workers o carregam e passam a gerar os mesmos vetores).
+    """
+    from firebase_admin import firestore
+    from app.services.firestore_client import get_firestore_client
+    from app.services.embedding_backends import CAMINHO_IDF, obter_backend, publicar_idf
+    from app.services.firestore_context import (
+        LIMITE_TEXTO_EMBEDDING,
+        embedding_precalculado,
+        extrair_texto_log,
+    )
+
+    db = get_firestore_client()
+    lidos = []
+    for col in colecoes:
+        try:
+            print(f"📂 [Snapshot] Lendo coleção '{col}'")
+            docs = (
+                db.collection(col)
+                .order_by("timestamp", direction=firestore.Query.DESCENDING)
+                .limit(limite_por_colecao)
+                .stream()
+            )
+            for doc in docs:
+                data = doc.to_dict()
+                texto = extrair_texto_log(data)
+                if texto:
+                    lidos.append((col, doc.id, data, texto))
+        except Exception as e:
+            print(f"⚠️ [Snapshot] Erro ao ler coleção {col}: {e}")
+
+    # 💻 IDF do backend local: ajustado uma única vez e compartilhado
+    if lidos and not os.path.exists(CAMINHO_IDF):
+        publicar_idf([texto for *_, texto in lidos])
+
+    backend = obter_backend()
+    atual = snapshot_atual(diretorio)
+    if atual and atual.backend != backend.nome:
+        atual = None
+    # Reaproveita o embedding da versão anterior ou o gravado na ingestão;
+    # os demais são gerados em lote
+    embeddings = []
+    for col, doc_id, data, _ in lidos:
+        embedding = atual.vetor(f"{col}/{doc_id}") if atual else None
+        if embedding is None:
+            embedding = embedding_precalculado(data, backend)
+        embeddings.append(embedding)
+
+    pendentes = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if pendentes:
+        print(f"🧮 [Snapshot] Gerando {len(pendentes)} embeddings em lote ({backend.nome})")
+        gerados = backend.gerar_lote([lidos[i][3][:LIMITE_TEXTO_EMBEDDING] for i in pendentes])
+        for i, embedding in zip(pendentes, gerados):
+            embeddings[i] = embedding
+
+    registros = []
+    dimensoes = None
+
+    for (col, doc_id, data, texto), embedding in zip(lidos, embeddings):
+        if embedding is None or len(embedding) == 0:
+            continue
+
+        dimensoes = dimensoes or len(embedding)
+        if len(embedding) != dimensoes:
+            continue
+
+        registros.append({
+            "colecao": col,
+            "doc_id": doc_id,
+            "texto": texto,
+            "timestamp": data.get("timestamp"),
+            "embedding": embedding,
+        })
+
+    if not registros:
+        print("⚠️ [Snapshot] Nenhum documento lido; versão atual mantida.")
+        return None
+
+    return gravar_snapshot(registros, dimensoes, diretorio, backend=backend.nome)
+
+
+# ==============================================================
+# 📖 Leitura (workers)
+# ==============================================================
+
+class RetrievalSnapshot:
+    """Visão somente leitura de um arquivo de snapshot mapeado em memória."""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        with open(caminho, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Arquivo de snapshot inválido: {caminho}")
+        tamanho = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 4], "little")
+        cabecalho = json.loads(self._mmap[len(MAGIC) + 4:len(MAGIC) + 4 + tamanho])
+
+        self.versao = cabecalho["versao"]
+        self.dimensoes = cabecalho["dimensoes"]
+        self.total = cabecalho["total"]
+        self.backend = cabecalho.get("backend", "openai-3-small-1536")
+        secoes = cabecalho["secoes"]
+
+        def visao(nome, dtype, shape=None):
+            inicio, tamanho_secao = secoes[nome]
+            arr = np.frombuffer(self._mmap, dtype=dtype, count=tamanho_secao // np.dtype(dtype).itemsize,
+                                offset=inicio)
+            return arr.reshape(shape) if shape else arr
+
+        self._codigos = visao("codigos", np.int8, (self.total, self.dimensoes))
+        self._escalas = visao("escalas", np.float32)
+        self._offsets_texto = visao("offsets_texto", np.uint64)
+        self._inicio_textos = secoes["textos"][0]
+
+        inicio, tamanho_secao = secoes["metadados"]
+        metadados = json.loads(self._mmap[inicio:inicio + tamanho_secao])
+        self._indices = {f"{col}/{doc_id}": i for i, (col, doc_id, _) in enumerate(metadados)}
+
+    def __len__(self) -> int:
+        return self.total
+
+    def contem(self, chave: str) -> bool:
+        return chave in self._indices
+
+    def texto(self, chave: str):
+        """Texto sanitizado do documento (lido direto do mmap)."""
+        i = self._indices.get(chave)
+        if i is None:
+            return None
+        inicio = self._inicio_textos + int(self._offsets_texto[i])
+        fim = self._inicio_textos + int(self._offsets_texto[i + 1])
+        return self._mmap[inicio:fim].decode("utf-8")
+
+    def vetor(self, chave: str):
+        """Embedding normalizado (float32 dequantizado) do documento."""
+        i = self._indices.get(chave)
+        if i is None:
+            return None
+        return (self._codigos[i].astype(np.float32) * self._escalas[i]).tolist()
+
+    def buscar(self, consulta, k: int = 10, chaves: list = None,
+               fator_lista_curta: int = FATOR_LISTA_CURTA, vetores_exatos=None) -> list:
+        """
+        Retorna as `k` chaves mais similares à consulta como [(chave, score)].
+        Como no store compacto, a lista curta (k × fator) é reavaliada em
+        float32 com `vetores_exatos(chaves) -> {chave: vetor}`, quando
+        informado; chaves sem vetor exato mantêm o score int8.
+        """
+        q = normalizar(consulta)[0]
+        if len(q) != self.dimensoes:
+            return []
+
+        if chaves is None:
+            nomes = list(self._indices)
+            indices = np.arange(self.total)
+        else:
+            nomes = [c for c in chaves if c in self._indices]
+            indices = np.array([self._indices[c] for c in nomes], dtype=np.int64)
+        if len(indices) == 0:
+            return []
+
+        scores = (self._codigos[indices].astype(np.float32) @ q) * self._escalas[indices]
+        if vetores_exatos is None:
+            ordem = np.argsort(-scores)[:k]
+            return [(nomes[i], float(scores[i])) for i in ordem]
+
+        # Reavaliação exata (float32) da lista curta
+        curta = np.argsort(-scores)[:max(k, k * fator_lista_curta)]
+        chaves_curtas = [nomes[i] for i in curta]
+        pontuacoes = scores[curta]
+        exatos = vetores_exatos(chaves_curtas) or {}
+        for j, chave in enumerate(chaves_curtas):
+            vetor = exatos.get(chave)
+            if vetor is not None and len(vetor) == self.dimensoes:
+                pontuacoes[j] = normalizar(vetor)[0] @ q
+        ordem = np.argsort(-pontuacoes)[:k]
+        return [(chaves_curtas[j], float(pontuacoes[j])) for j in ordem]
+
+
+# ==============================================================
+# 🔁 Troca automática de versão
+# ==============================================================
+
+_atual = None
+_ultima_verificacao = 0.0
+_lock = threading.Lock()
+
+def snapshot_atual(diretorio: str = SNAPSHOT_DIR):
+    """
+    Retorna o snapshot publicado mais recente (ou None se não houver).
+    Verifica o arquivo CURRENT no máximo a cada INTERVALO_VERIFICACAO segundos
+    e troca de versão de forma atômica; requisições em andamento continuam
+    usando a referência antiga até terminarem.
+    """
+    global _atual, _ultima_verificacao
+
+    agora = time.monotonic()
+    if agora - _ultima_verificacao < INTERVALO_VERIFICACAO:
+        return _atual
+
+    with _lock:
+        if agora - _ultima_verificacao < INTERVALO_VERIFICACAO:
+            return _atual
+        _ultima_verificacao = agora
+
+        try:
+            with open(os.path.join(diretorio, "CURRENT")) as f:
+                nome = f.read().strip()
+        except OSError:
+            return _atual
+
+        caminho = os.path.join(diretorio, nome)
+        if _atual is not None and _atual.caminho == caminho:
+            return _atual
+
+        try:
+            _atual = RetrievalSnapshot(caminho)
+            print(f"🧊 [Snapshot] Versão {_atual.versao} carregada (pid {os.getpid()}, {len(_atual)} documentos).")
+        except (OSError, ValueError) as e:
+            print(f"⚠️ [Snapshot] Falha ao carregar {caminho}: {e}")
+
+        return _atual
+
+
+# ==============================================================
+# 🚀 Execução como script (construtor)
+# ==============================================================
+
+if __name__ == "__main__":
+    from app.services.collection_registry import registro_colecoes
+
+    parser = argparse.ArgumentParser(description="Constrói o snapshot de recuperação compartilhado.")
+    parser.add_argument("--diretorio", default=SNAPSHOT_DIR)
+    parser.add_argument("--limite", type=int, default=2000, help="Documentos por coleção")
+    parser.add_argument("--intervalo", type=int, default=0,
+                        help="Reconstrói a cada N segundos (0 = executa uma vez)")
+    args = parser.parse_args()
+
+    while True:
+        construir_snapshot(registro_colecoes.nomes(), args.limite, args.diretorio)
+        if not args.intervalo:
+            sys.exit(0)
+        time.sleep(args.intervalo)
@@ -0,0 +1,212 @@
+# ==============================================================
+# 🧭 app/services/retrieval_strategies.py
+# --------------------------------------------------------------
+# Registro das estratégias de recuperação de contexto:
+#   - recencia:  últimos documentos, sem embeddings (mais barata)
+#   - lexica:    termos da pergunta presentes no log
+#   - semantica: similaridade de embeddings (padrão)
+#   - hibrida:   combinação dos scores semântico e léxico
+# A estratégia é escolhida por requisição, por perfil ou pela
+# configuração da implantação, nessa ordem de precedência.
+# No modo sombra, uma segunda estratégia roda em background
+# (pool pequeno e limitado; comparações excedentes são descartadas)
+# sobre a mesma pergunta e registra a sobreposição dos
+# resultados e a diferença de latência, sem afetar a resposta.
+# ==============================================================
+
+import os
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.deadline import Deadline
+from app.utils.tiered_cache import obter_cache
+
+# ==============================================================
+# ⚙️ Configuração
+# ==============================================================
+
+ESTRATEGIA_PADRAO = os.getenv("RETRIEVAL_ESTRATEGIA", "semantica")
+# Ex.: "gerencial=recencia,engenharia=hibrida"
+ESTRATEGIAS_PERFIS = os.getenv("RETRIEVAL_ESTRATEGIA_PERFIS", "")
+ESTRATEGIA_SOMBRA = os.getenv("RETRIEVAL_SOMBRA")  # desativado quando ausente
+AMOSTRA_SOMBRA = float(os.getenv("RETRIEVAL_SOMBRA_AMOSTRA", "0.1"))
+WORKERS_SOMBRA = int(os.getenv("RETRIEVAL_SOMBRA_WORKERS", "2"))
+# Comparações em execução ou na fila; acima disso são descartadas
+MAX_PENDENTES_SOMBRA = WORKERS_SOMBRA * 2
+# Contextos envelhecem rápido (novos logs chegam o tempo todo): TTL curto
+TTL_CACHE_CONTEXTOS = int(os.getenv("CACHE_TTL_CONTEXTOS_SEGUNDOS", "60"))
+
+
+def carregar_estrategias_perfis(config: str) -> dict:
+    """Converte "perfil=estrategia,..." em dicionário."""
+    perfis = {}
+    for item in config.split(","):
+        if "=" in item:
+            perfil, nome = item.split("=", 1)
+            perfis[perfil.strip()] = nome.strip()
+    return perfis
+
+
+# ==============================================================
+# 🧩 Interface
+# ==============================================================
+
+class EstrategiaRecuperacao:
+    """
+    Estratégia de recuperação sobre `buscar_candidatos`.
+    Todas devolvem (candidatos, ultimo_timestamp) no mesmo formato,
+    respeitando o deadline e a busca incremental das sessões.
+    """
+
+    def __init__(self, nome: str, ranqueamento: str):
+        self.nome = nome
+        self.ranqueamento = ranqueamento
+
+    def buscar(self, pergunta: str, colecoes: list, limite: int = 10,
+               desde=None, deadline: Deadline = None):
+        # Import tardio: firestore_context importa o snapshot e o store,
+        # que não devem ser carregados só para registrar as estratégias
+        from app.services.firestore_context import buscar_candidatos
+        return buscar_candidatos(pergunta, colecoes, limite=limite, desde=desde,
+                                 deadline=deadline, ranqueamento=self.ranqueamento)
+
+    def atualizar(self, pergunta: str, candidatos_anteriores: list, colecoes: list,
+                  desde, limite: int = 10, deadline: Deadline = None):
+        from app.services.firestore_context import atualizar_candidatos
+        return atualizar_candidatos(pergunta, candidatos_anteriores, colecoes, desde,
+                                    limite=limite, deadline=deadline, ranqueamento=self.ranqueamento)
+
+
+ESTRATEGIAS = {
+    "recencia": EstrategiaRecuperacao("recencia", "recencia"),
+    "lexica": EstrategiaRecuperacao("lexica", "lexico"),
+    "semantica": EstrategiaRecuperacao("semantica", "semantico"),
+    "hibrida": EstrategiaRecuperacao("hibrida", "hibrido"),
+}
+
+_perfis = carregar_estrategias_perfis(ESTRATEGIAS_PERFIS)
+
+
+def obter_estrategia(nome: str = None, perfil: str = None) -> EstrategiaRecuperacao:
+    """
+    Resolve a estratégia: pedido explícito → perfil → padrão da implantação.
+    Levanta ValueError para nomes desconhecidos.
+    """
+    escolhida = nome or _perfis.get(perfil or "") or ESTRATEGIA_PADRAO
+    if escolhida not in ESTRATEGIAS:
+        raise ValueError(f"Estratégia de recuperação desconhecida: {escolhida} "
+                         f"(disponíveis: {', '.join(ESTRATEGIAS)})")
+    return ESTRATEGIAS[escolhida]
+
+
+# ==============================================================
+# 👥 Modo sombra
+# ==============================================================
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+# Threads só são criadas no primeiro envio
+_pool_sombra = ThreadPoolExecutor(max_workers=WORKERS_SOMBRA, thread_name_prefix="sombra")
+_pendentes_sombra = threading.BoundedSemaphore(MAX_PENDENTES_SOMBRA)
+_descartes_sombra = 0
+
+
+def _executar_sombra(sombra: EstrategiaRecuperacao, principal: str, candidatos: list,
+                     latencia_principal: float, pergunta: str, colecoes: list, limite: int):
+    try:
+        inicio = time.perf_counter()
+        candidatos_sombra, _ = sombra.buscar(pergunta, colecoes, limite=limite)
+        latencia_sombra = time.perf_counter() - inicio
+
+        top_principal = [(c["colecao"], c["doc_id"]) for c in candidatos]
+        top_sombra = [(c["colecao"], c["doc_id"]) for c in candidatos_sombra]
+        print(json.dumps({
+            "evento": "retrieval_sombra",
+            "principal": principal,
+            "sombra": sombra.nome,
+            "jaccard": round(jaccard(set(top_principal), set(top_sombra)), 3),
+            "mesmo_primeiro": bool(top_principal and top_sombra and top_principal[0] == top_sombra[0]),
+            "resultados_principal": len(top_principal),
+            "resultados_sombra": len(top_sombra),
+            "latencia_principal_ms": round(latencia_principal * 1000, 1),
+            "latencia_sombra_ms": round(latencia_sombra * 1000, 1),
+            "diferenca_ms": round((latencia_sombra - latencia_principal) * 1000, 1),
+        }, ensure_ascii=False))
+    except Exception as e:
+        print(f"⚠️ [Sombra] Erro na estratégia '{sombra.nome}': {e}")
+    finally:
+        _pendentes_sombra.release()
+
+
+def comparar_em_sombra(principal: EstrategiaRecuperacao, candidatos: list, latencia: float,
+                       pergunta: str, colecoes: list, limite: int = 10):
+    """
+    Dispara a estratégia sombra em background (quando configurada).
+    Com o pool saturado, a comparação é descartada: o modo sombra nunca
+    acumula trabalho nem disputa recursos com as requisições.
+    """
+    global _descartes_sombra
+    sombra = ESTRATEGIAS.get(ESTRATEGIA_SOMBRA or "")
+    if sombra is None or sombra is principal or random.random() >= AMOSTRA_SOMBRA:
+        return
+    if not _pendentes_sombra.acquire(blocking=False):
+        _descartes_sombra += 1
+        if _descartes_sombra % 100 == 1:
+            print(f"⚠️ [Sombra] Pool saturado: {_descartes_sombra} comparações descartadas até agora.")
+        return
+
+    try:
+        _pool_sombra.submit(
+            _executar_sombra, sombra, principal.nome, list(candidatos), latencia, pergunta, list(colecoes), limite
+        )
+    except RuntimeError:
+        # Pool encerrado (desligamento do processo)
+        _pendentes_sombra.release()
+
+
+# ==============================================================
+# 🔍 Recuperação com medição
+# ==============================================================
+
+def recuperar(estrategia: EstrategiaRecuperacao, pergunta: str, colecoes: list,
+              candidatos_anteriores: list = None, desde=None, limite: int = 10,
+              deadline: Deadline = None):
+    """
+    Executa a estratégia (busca completa ou incremental, se houver
+    candidatos anteriores) e dispara a comparação em sombra.
+    Buscas completas usam o cache de contextos (compartilhado entre
+    instâncias); resultados degradados pelo deadline não são guardados.
+    """
+    cache = chave = None
+    if not candidatos_anteriores:
+        cache = obter_cache("contextos", TTL_CACHE_CONTEXTOS)
+        chave = f"{estrategia.nome}|{','.join(colecoes)}|{limite}|{' '.join(pergunta.lower().split())}"
+        em_cache = cache.obter(chave)
+        if em_cache is not None:
+            print(f"🧊 [Recuperação] Contexto em cache para a estratégia '{estrategia.nome}'.")
+            return em_cache["candidatos"], em_cache["ultimo_timestamp"]
+
+    inicio = time.perf_counter()
+    if candidatos_anteriores:
+        candidatos, ultimo_timestamp = estrategia.atualizar(
+            pergunta, candidatos_anteriores, colecoes, desde, limite=limite, deadline=deadline
+        )
+    else:
+        candidatos, ultimo_timestamp = estrategia.buscar(
+            pergunta, colecoes, limite=limite, deadline=deadline
+        )
+    latencia = time.perf_counter() - inicio
+    print(f"🧭 [Recuperação] Estratégia '{estrategia.nome}': {len(candidatos)} candidatos "
+          f"em {latencia * 1000:.0f} ms.")
+
+    if cache is not None and candidatos and (deadline is None or deadline.modo == "completo"):
+        cache.definir(chave, {"candidatos": candidatos, "ultimo_timestamp": ultimo_timestamp})
+
+    comparar_em_sombra(estrategia, candidatos, latencia, pergunta, colecoes, limite)
+    return candidatos, ultimo_timestamp
@@ -0,0 +1,177 @@
+# ==============================================================
+# 🗂️ app/services/session_store.py
+# --------------------------------------------------------------
+# Armazena sessões de chat multi-turno em memória (LRU com TTL)
+# e, com o L2 do cache configurado, também na camada compartilhada:
+# com vários workers/instâncias, o acompanhamento pode cair em
+# outro processo e ainda encontrar a sessão.
+# Cada sessão guarda o contexto recuperado, os documentos
+# ranqueados e um resumo incremental dos turnos anteriores,
+# permitindo que perguntas de acompanhamento reutilizem o
+# contexto sem refazer toda a busca no Firestore.
+# ==============================================================
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from app.utils.tiered_cache import PREFIXO_CHAVES, desserializar, obter_l2, serializar
+
+# ==============================================================
+# ⚙️ Configuração
+# ==============================================================
+
+MAX_SESSOES = int(os.getenv("CHAT_SESSION_MAX", "500"))
+TTL_SESSAO_SEGUNDOS = int(os.getenv("CHAT_SESSION_TTL_SEGUNDOS", "1800"))
+LIMITE_RESUMO_CARACTERES = 1500
+LIMITE_RESPOSTA_NO_RESUMO = 240
+
+
+# ==============================================================
+# 🧾 Estrutura da sessão
+# ==============================================================
+
+@dataclass
+class SessaoChat:
+    session_id: str
+    estilo_usuario: str = ""
+    # Pergunta que originou o contexto: os documentos novos dos turnos
+    # seguintes são pontuados contra ela, mantendo os scores comparáveis
+    pergunta_ancora: str = ""
+    colecoes: list = field(default_factory=list)
+    candidatos: list = field(default_factory=list)
+    ultimo_timestamp: object = None
+    resumo: str = ""
+    turnos: int = 0
+    atualizado_em: float = field(default_factory=time.monotonic)
+
+    @property
+    def doc_ids(self) -> list:
+        """IDs dos documentos ranqueados, na ordem de relevância."""
+        return [c["doc_id"] for c in self.candidatos]
+
+    def registrar_turno(self, pergunta: str, resposta: str):
+        """
+        Acrescenta o turno ao resumo incremental da sessão.
+        Mantém apenas os turnos mais recentes dentro do limite de caracteres.
+        """
+        resposta_curta = " ".join((resposta or "").split())[:LIMITE_RESPOSTA_NO_RESUMO].strip()
+        turno = f"P: {' '.join(pergunta.split())} | R: {resposta_curta}"
+
+        turnos = [t for t in self.resumo.split("\n") if t] + [turno]
+        while len(turnos) > 1 and len("\n".join(turnos)) > LIMITE_RESUMO_CARACTERES:
+            turnos.pop(0)
+
+        self.resumo = "\n".join(turnos)[-LIMITE_RESUMO_CARACTERES:]
+        self.turnos += 1
+
+
+# ==============================================================
+# 🧠 Armazenamento LRU com expiração
+# ==============================================================
+
+class SessionStore:
+    """
+    Armazenamento limitado de sessões: remove as menos usadas e as expiradas.
+    Com `l2`, a cópia compartilhada é a de referência (outro processo pode
+    ter atualizado a sessão); a cópia local só é usada se o L2 falhar.
+    """
+
+    def __init__(self, max_sessoes: int = MAX_SESSOES, ttl_segundos: int = TTL_SESSAO_SEGUNDOS, l2=None):
+        self.max_sessoes = max_sessoes
+        self.ttl_segundos = ttl_segundos
+        self.l2 = l2
+        self._sessoes = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ----------------------------------------------------------
+    # 🌐 Cópia compartilhada (L2)
+    # ----------------------------------------------------------
+    def _chave_l2(self, session_id: str) -> str:
+        return f"{PREFIXO_CHAVES}:sessoes:{hashlib.sha256(session_id.encode()).hexdigest()[:32]}"
+
+    def _ler_l2(self, session_id: str):
+        dados = self.l2.get(self._chave_l2(session_id))
+        return SessaoChat(**desserializar(dados)) if dados is not None else None
+
+    def _gravar_l2(self, sessao: SessaoChat):
+        campos = asdict(sessao)
+        del campos["atualizado_em"]  # relógio monotônico: só vale no processo
+        campos["candidatos"] = [dict(c, score=float(c.get("score", 0.0))) for c in sessao.candidatos]
+        try:
+            self.l2.set(self._chave_l2(sessao.session_id), serializar(campos), ex=self.ttl_segundos)
+        except Exception as e:
+            print(f"⚠️ [Sessões] Erro de escrita no L2: {e}")
+
+    # ----------------------------------------------------------
+    # 📥 Leitura e escrita
+    # ----------------------------------------------------------
+
+    def _expirada(self, sessao: SessaoChat, agora: float) -> bool:
+        return agora - sessao.atualizado_em > self.ttl_segundos
+
+    def obter(self, session_id: str):
+        """Retorna a sessão ativa (ou None se não existir ou tiver expirado)."""
+        if not session_id:
+            return None
+
+        if self.l2 is not None:
+            try:
+                return self._ler_l2(session_id)
+            except Exception as e:
+                print(f"⚠️ [Sessões] Erro de leitura no L2; usando a cópia local: {e}")
+
+        with self._lock:
+            sessao = self._sessoes.get(session_id)
+            if sessao is None:
+                return None
+            if self._expirada(sessao, time.monotonic()):
+                del self._sessoes[session_id]
+                return None
+            self._sessoes.move_to_end(session_id)
+            return sessao
+
+    def possui_contexto(self, session_id: str) -> bool:
+        """Indica se a sessão já tem contexto recuperado para reaproveitar."""
+        sessao = self.obter(session_id)
+        return bool(sessao and sessao.candidatos)
+
+    def salvar(self, sessao: SessaoChat):
+        """Grava a sessão como a mais recente e aplica os limites de tamanho e TTL."""
+        agora = time.monotonic()
+        sessao.atualizado_em = agora
+
+        with self._lock:
+            self._sessoes[sessao.session_id] = sessao
+            self._sessoes.move_to_end(sessao.session_id)
+
+            # Remove expiradas a partir das mais antigas
+            while self._sessoes:
+                mais_antiga = next(iter(self._sessoes.values()))
+                if not self._expirada(mais_antiga, agora):
+                    break
+                self._sessoes.popitem(last=False)
+
+            while len(self._sessoes) > self.max_sessoes:
+                self._sessoes.popitem(last=False)
+
+        if self.l2 is not None:
+            self._gravar_l2(sessao)
+
+    def remover(self, session_id: str):
+        with self._lock:
+            self._sessoes.pop(session_id, None)
+        if self.l2 is not None:
+            try:
+                self.l2.delete(self._chave_l2(session_id))
+            except Exception as e:
+                print(f"⚠️ [Sessões] Erro ao remover do L2: {e}")
+
+    def __len__(self) -> int:
+        return len(self._sessoes)
+
+
+# Instância compartilhada pelo processo (usa o mesmo L2 dos caches)
+sessoes = SessionStore(l2=obter_l2())
@@ -0,0 +1,62 @@
+# ==============================================================
+# 📈 app/services/usage_metrics.py
+# --------------------------------------------------------------
+# Métricas de uso de tokens por template de prompt, incluindo a
+# proporção de tokens servidos pelo cache de prompt do provedor.
+# ==============================================================
+
+import threading
+from collections import defaultdict
+
+_metricas = defaultdict(lambda: {
+    "requisicoes": 0,
+    "prompt_tokens": 0,
+    "cached_tokens": 0,
+    "completion_tokens": 0,
+    "latencia_total_s": 0.0,
+})
+_lock = threading.Lock()
+
+
+def registrar_uso(template_id: str, usage, latencia_s: float = 0.0) -> dict:
+    """
+    Contabiliza o `usage` retornado pela OpenAI para o template.
+    Retorna os números desta requisição (para log estruturado).
+    """
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    # openai 1.45 não tipa `prompt_tokens_details`: chega como dict
+    detalhes = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(detalhes, dict):
+        cached_tokens = detalhes.get("cached_tokens") or 0
+    else:
+        cached_tokens = getattr(detalhes, "cached_tokens", 0) or 0
+
+    with _lock:
+        m = _metricas[template_id]
+        m["requisicoes"] += 1
+        m["prompt_tokens"] += prompt_tokens
+        m["cached_tokens"] += cached_tokens
+        m["completion_tokens"] += completion_tokens
+        m["latencia_total_s"] += latencia_s
+
+    return {
+        "template": template_id,
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "completion_tokens": completion_tokens,
+        "cache_ratio": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+    }
+
+
+def resumo_uso() -> dict:
+    """Resumo acumulado por template, com proporção de cache e latência média."""
+    with _lock:
+        resumo = {}
+        for template_id, m in _metricas.items():
+            resumo[template_id] = {
+                **{k: v for k, v in m.items() if k != "latencia_total_s"},
+                "cache_ratio": round(m["cached_tokens"] / m["prompt_tokens"], 3) if m["prompt_tokens"] else 0.0,
+                "latencia_media_s": round(m["latencia_total_s"] / m["requisicoes"], 3) if m["requisicoes"] else 0.0,
+            }
+        return resumo
@@ -0,0 +1,55 @@
+# ==============================================================
+# ⏱️ app/utils/deadline.py
+# --------------------------------------------------------------
+# Prazo (deadline) por requisição, propagado por todo o pipeline.
+# Cada etapa consulta o orçamento restante e, quando ele é
+# insuficiente, degrada para um modo mais barato:
+#   completo → pool_reduzido → recencia → agregados
+# O modo final é informado na resposta e no log estruturado.
+# ==============================================================
+
+import os
+import time
+
+# ==============================================================
+# ⚙️ Configuração
+# ==============================================================
+
+DEADLINE_SEGUNDOS = float(os.getenv("CHAT_DEADLINE_SEGUNDOS", "25"))
+RESERVA_GERACAO_SEGUNDOS = float(os.getenv("CHAT_RESERVA_GERACAO_SEGUNDOS", "10"))
+LIMIAR_POOL_REDUZIDO_SEGUNDOS = float(os.getenv("CHAT_LIMIAR_POOL_REDUZIDO_SEGUNDOS", "8"))
+LIMIAR_RECENCIA_SEGUNDOS = float(os.getenv("CHAT_LIMIAR_RECENCIA_SEGUNDOS", "3"))
+LIMIAR_AGREGADOS_SEGUNDOS = float(os.getenv("CHAT_LIMIAR_AGREGADOS_SEGUNDOS", "1"))
+
+# Modos em ordem crescente de degradação
+MODOS = ("completo", "pool_reduzido", "recencia", "agregados")
+
+
+class Deadline:
+    """Prazo de uma requisição e o modo de degradação efetivamente usado."""
+
+    def __init__(self, segundos: float = DEADLINE_SEGUNDOS,
+                 reserva_geracao: float = RESERVA_GERACAO_SEGUNDOS):
+        self.segundos = segundos
+        self.reserva_geracao = reserva_geracao
+        self._limite = time.monotonic() + segundos
+        self.modo = "completo"
+        self.motivos = []
+
+    def restante(self) -> float:
+        """Segundos até o fim do prazo (nunca negativo)."""
+        return max(0.0, self._limite - time.monotonic())
+
+    def orcamento_recuperacao(self) -> float:
+        """Tempo disponível para recuperação de contexto (reserva a geração da resposta)."""
+        return max(0.0, self.restante() - self.reserva_geracao)
+
+    def expirado(self) -> bool:
+        return self.restante() <= 0
+
+    def degradar(self, modo: str, motivo: str):
+        """Registra a degradação; o modo só avança (nunca volta a um modo mais completo)."""
+        if MODOS.index(modo) > MODOS.index(self.modo):
+            self.modo = modo
+        self.motivos.append(motivo)
+        print(f"⏱️ [Deadline] Degradação para '{modo}': {motivo} (restam {self.restante():.2f}s)")
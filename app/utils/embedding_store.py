@@ -0,0 +1,245 @@
+# ==============================================================
+# 🗜️ app/utils/embedding_store.py
+# --------------------------------------------------------------
+# Armazenamento compacto de embeddings em memória.
+# Os vetores ficam em arrays contíguos NumPy, quantizados em
+# int8 (com escala por vetor) ou float16, em vez de listas Python
+# de floats (≈50 KB por vetor de 1536 dimensões).
+# A busca ranqueia com os vetores compactos e reavalia a lista
+# curta final em float32 exato: vetores obtidos sob demanda pelo
+# chamador (cache de embeddings, campo `embedding` do documento)
+# ou, opcionalmente, uma cópia float32 em disco (memmap).
+# ==============================================================
+
+import os
+import threading
+import numpy as np
+
+# ==============================================================
+# ⚙️ Configuração
+# ==============================================================
+
+CAPACIDADE_PADRAO = int(os.getenv("EMBEDDING_STORE_CAPACIDADE", "50000"))
+MODO_PADRAO = os.getenv("EMBEDDING_STORE_MODO", "int8")  # int8 | float16
+DIRETORIO_EXATO = os.getenv("EMBEDDING_STORE_EXATO_DIR")  # opt-in: cópia float32 em disco
+FATOR_LISTA_CURTA = 4
+LINHAS_POR_BLOCO = 65536
+
+
+# ==============================================================
+# 🔧 Quantização
+# ==============================================================
+
+def normalizar(vetores) -> np.ndarray:
+    """Converte para float32 e normaliza cada vetor (norma L2 = 1)."""
+    matriz = np.atleast_2d(np.asarray(vetores, dtype=np.float32))
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+
+def quantizar_int8(matriz: np.ndarray):
+    """Quantiza cada linha em int8 com escala própria (simétrica)."""
+    escalas = np.abs(matriz).max(axis=1) / 127.0
+    escalas[escalas == 0] = 1.0
+    codigos = np.clip(np.rint(matriz / escalas[:, None]), -127, 127).astype(np.int8)
+    return codigos, escalas.astype(np.float32)
+
+
+def dequantizar_int8(codigos: np.ndarray, escalas: np.ndarray) -> np.ndarray:
+    return codigos.astype(np.float32) * escalas[:, None]
+
+
+# ==============================================================
+# 🗃️ Armazenamento compacto
+# ==============================================================
+
+class CompactEmbeddingStore:
+    """
+    Armazena até `capacidade` vetores normalizados, indexados por chave.
+    Quando cheio, sobrescreve o vetor mais antigo (buffer circular).
+    """
+
+    def __init__(self, dimensoes: int, capacidade: int = CAPACIDADE_PADRAO,
+                 modo: str = MODO_PADRAO, caminho_exato: str = None):
+        if modo not in ("int8", "float16"):
+            raise ValueError(f"Modo de quantização inválido: {modo}")
+
+        self.dimensoes = dimensoes
+        self.capacidade = capacidade
+        self.modo = modo
+
+        if modo == "int8":
+            self._codigos = np.zeros((capacidade, dimensoes), dtype=np.int8)
+            self._escalas = np.zeros(capacidade, dtype=np.float32)
+        else:
+            self._codigos = np.zeros((capacidade, dimensoes), dtype=np.float16)
+            self._escalas = None
+
+        # Cópia float32 opcional em disco (memmap) para reavaliação exata
+        self._exatos = None
+        if caminho_exato:
+            self._exatos = np.memmap(caminho_exato, dtype=np.float32, mode="w+",
+                                     shape=(capacidade, dimensoes))
+
+        self._chaves = [None] * capacidade
+        self._slots = {}
+        self._proximo = 0
+        self._lock = threading.Lock()
+
+    # ----------------------------------------------------------
+    # 📥 Escrita e leitura
+    # ----------------------------------------------------------
+    def adicionar(self, chave: str, vetor) -> int:
+        """Adiciona (ou substitui) o vetor da chave. Retorna o slot usado."""
+        if len(vetor) != self.dimensoes:
+            raise ValueError(f"Dimensão {len(vetor)} diferente da esperada ({self.dimensoes}).")
+
+        linha = normalizar(vetor)
+
+        with self._lock:
+            slot = self._slots.get(chave)
+            if slot is None:
+                slot = self._proximo
+                self._proximo = (self._proximo + 1) % self.capacidade
+                antiga = self._chaves[slot]
+                if antiga is not None:
+                    del self._slots[antiga]
+                self._chaves[slot] = chave
+                self._slots[chave] = slot
+
+            if self.modo == "int8":
+                codigos, escalas = quantizar_int8(linha)
+                self._codigos[slot] = codigos[0]
+                self._escalas[slot] = escalas[0]
+            else:
+                self._codigos[slot] = linha[0].astype(np.float16)
+
+            if self._exatos is not None:
+                self._exatos[slot] = linha[0]
+
+        return slot
+
+    def contem(self, chave: str) -> bool:
+        return chave in self._slots
+
+    def obter(self, chave: str):
+        """Retorna o vetor (normalizado, float32) da chave ou None."""
+        slot = self._slots.get(chave)
+        if slot is None:
+            return None
+        return self._linhas_exatas([slot])[0]
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def bytes_em_memoria(self) -> int:
+        """Memória residente dos vetores compactos (sem a cópia exata em disco)."""
+        total = self._codigos.nbytes
+        if self._escalas is not None:
+            total += self._escalas.nbytes
+        return total
+
+    # ----------------------------------------------------------
+    # 🔢 Pontuação
+    # ----------------------------------------------------------
+    def _linhas_compactas(self, slots) -> np.ndarray:
+        if self.modo == "int8":
+            return dequantizar_int8(self._codigos[slots], self._escalas[slots])
+        return self._codigos[slots].astype(np.float32)
+
+    def _linhas_exatas(self, slots) -> np.ndarray:
+        if self._exatos is not None:
+            return np.asarray(self._exatos[slots], dtype=np.float32)
+        return self._linhas_compactas(slots)
+
+    def _pontuar_compacto(self, consulta: np.ndarray, slots: np.ndarray) -> np.ndarray:
+        """Produto interno aproximado, em blocos para limitar a memória temporária."""
+        pontuacoes = np.empty(len(slots), dtype=np.float32)
+        for inicio in range(0, len(slots), LINHAS_POR_BLOCO):
+            bloco = slots[inicio:inicio + LINHAS_POR_BLOCO]
+            if self.modo == "int8":
+                pontuacoes[inicio:inicio + len(bloco)] = (
+                    (self._codigos[bloco].astype(np.float32) @ consulta) * self._escalas[bloco]
+                )
+            else:
+                pontuacoes[inicio:inicio + len(bloco)] = self._codigos[bloco].astype(np.float32) @ consulta
+        return pontuacoes
+
+    def buscar(self, consulta, k: int = 10, chaves: list = None,
+               fator_lista_curta: int = FATOR_LISTA_CURTA, vetores_exatos=None) -> list:
+        """
+        Retorna as `k` chaves mais similares à consulta como [(chave, score)].
+        - `chaves`: restringe a busca a um subconjunto (ex.: documentos lidos agora).
+        - A lista curta (k × fator) é reavaliada em float32: com a cópia em
+          disco, se houver; senão com `vetores_exatos(chaves) -> {chave: vetor}`,
+          chamado fora do lock. Chaves sem vetor exato mantêm a linha compacta.
+        """
+        q = normalizar(consulta)[0]
+
+        with self._lock:
+            if chaves is None:
+                slots = np.fromiter(self._slots.values(), dtype=np.int64)
+            else:
+                slots = np.fromiter(
+                    (self._slots[c] for c in chaves if c in self._slots), dtype=np.int64
+                )
+            if len(slots) == 0:
+                return []
+
+            aproximadas = self._pontuar_compacto(q, slots)
+
+            # Lista curta pelos scores aproximados
+            n_curta = min(len(slots), max(k, k * fator_lista_curta))
+            if n_curta < len(slots):
+                indices = np.argpartition(-aproximadas, n_curta - 1)[:n_curta]
+            else:
+                indices = np.arange(len(slots))
+            slots_curtos = slots[indices]
+            chaves_curtas = [self._chaves[slot] for slot in slots_curtos]
+            linhas = self._linhas_exatas(slots_curtos)
+            com_copia_exata = self._exatos is not None
+
+        # Reavaliação exata (float32) da lista curta, sem segurar o lock
+        if not com_copia_exata and vetores_exatos is not None:
+            exatos = vetores_exatos(chaves_curtas) or {}
+            for i, chave in enumerate(chaves_curtas):
+                vetor = exatos.get(chave)
+                if vetor is not None and len(vetor) == self.dimensoes:
+                    linhas[i] = normalizar(vetor)[0]
+
+        pontuacoes = linhas @ q
+        ordem = np.argsort(-pontuacoes)[:k]
+        return [(chaves_curtas[i], float(pontuacoes[i])) for i in ordem]
+
+
+# ==============================================================
+# 🧠 Instâncias compartilhadas (uma por backend e dimensão)
+# ==============================================================
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def obter_store(dimensoes: int, backend: str = "openai") -> CompactEmbeddingStore:
+    """
+    Retorna o armazenamento compartilhado do processo para o backend e a
+    dimensão informados (vetores de backends diferentes nunca se misturam).
+    """
+    chave = (backend, dimensoes)
+    with _stores_lock:
+        store = _stores.get(chave)
+        if store is None:
+            caminho_exato = None
+            if DIRETORIO_EXATO:
+                os.makedirs(DIRETORIO_EXATO, exist_ok=True)
+                # Um arquivo por processo: a cópia é escrita (mode w+) e os slots
+                # variam entre workers, que não podem compartilhar o mesmo arquivo
+                caminho_exato = os.path.join(
+                    DIRETORIO_EXATO, f"embeddings_{backend}_{dimensoes}_{os.getpid()}_f32.bin"
+                )
+            store = CompactEmbeddingStore(dimensoes, caminho_exato=caminho_exato)
+            _stores[chave] = store
+            print(f"🗜️ [Embeddings] Store compacto criado ({backend}, {store.modo}, {dimensoes} dimensões, "
+                  f"{store.bytes_em_memoria / 1024 / 1024:.1f} MB).")
+        return store
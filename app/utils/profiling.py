@@ -0,0 +1,176 @@
+# ==============================================================
+# 🔬 app/utils/profiling.py
+# --------------------------------------------------------------
+# Profiling sob demanda de uma requisição do /chat.
+# Ativado pelo header `X-Profile` (ou query `?profile=`) e
+# restrito ao token de administrador (`X-Admin-Token`).
+# Modos:
+#   - deterministico: cProfile → artefato .pstats
+#   - amostragem: amostras de pilha a cada 5 ms → artefato
+#     .collapsed (formato de flamegraph: "a;b;c contagem")
+# Sem o header, nada é instanciado: custo zero no caminho normal.
+# ==============================================================
+
+import os
+import io
+import sys
+import hmac
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from fastapi import HTTPException, Request
+
+# ==============================================================
+# ⚙️ Configuração
+# ==============================================================
+
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN")  # sem token → profiling desativado
+PROFILING_DIR = os.getenv("PROFILING_DIR", "/tmp/profiles")
+INTERVALO_AMOSTRAGEM = 0.005
+TOP_FUNCOES = 10
+
+MODOS = {
+    "1": "deterministico",
+    "true": "deterministico",
+    "pstats": "deterministico",
+    "deterministico": "deterministico",
+    "sampling": "amostragem",
+    "collapsed": "amostragem",
+    "amostragem": "amostragem",
+}
+
+
+# ==============================================================
+# 🔐 Autorização
+# ==============================================================
+
+def verificar_admin(request: Request):
+    """Levanta 403 se o token de administrador estiver ausente, incorreto ou não configurado."""
+    token = request.headers.get("X-Admin-Token", "")
+    if not PROFILING_ADMIN_TOKEN or not hmac.compare_digest(token, PROFILING_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="❌ Profiling restrito a administradores.")
+
+
+def modo_profiling(request: Request):
+    """
+    Retorna o modo de profiling pedido na requisição (ou None).
+    Levanta 403 se o profiling for pedido sem o token de administrador.
+    """
+    pedido = request.headers.get("X-Profile") or request.query_params.get("profile")
+    if not pedido:
+        return None
+
+    verificar_admin(request)
+
+    modo = MODOS.get(pedido.strip().lower())
+    if not modo:
+        raise HTTPException(status_code=400, detail=f"❌ Modo de profiling inválido: {pedido}")
+    return modo
+
+
+def caminho_artefato(nome: str) -> str:
+    """Caminho seguro de um artefato (impede acesso fora do diretório de profiles)."""
+    nome = os.path.basename(nome)
+    caminho = os.path.join(PROFILING_DIR, nome)
+    if not os.path.isfile(caminho):
+        raise HTTPException(status_code=404, detail="Artefato de profiling não encontrado.")
+    return caminho
+
+
+# ==============================================================
+# 📸 Amostrador de pilhas
+# ==============================================================
+
+class AmostradorPilhas:
+    """Coleta amostras periódicas da pilha de uma thread (pilhas colapsadas)."""
+
+    def __init__(self, thread_id: int, intervalo: float = INTERVALO_AMOSTRAGEM):
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                pilha.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                frame = frame.f_back
+            if pilha:
+                self.pilhas[";".join(reversed(pilha))] += 1
+
+    def iniciar(self):
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def top(self, n: int = TOP_FUNCOES) -> list:
+        """Funções mais frequentes no topo da pilha (tempo próprio)."""
+        folhas = Counter()
+        for pilha, contagem in self.pilhas.items():
+            folhas[pilha.rsplit(";", 1)[-1]] += contagem
+        total = sum(folhas.values()) or 1
+        return [f"{funcao} {contagem / total:.1%}" for funcao, contagem in folhas.most_common(n)]
+
+
+# ==============================================================
+# 🔬 Contexto de profiling
+# ==============================================================
+
+@contextmanager
+def perfilar(modo: str, hash_execucao: str):
+    """
+    Executa o bloco sob profiling e grava o artefato em PROFILING_DIR.
+    O dict entregue é preenchido ao final com modo, artefato e top funções.
+    """
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    resultado = {"modo": modo}
+    carimbo = time.strftime("%Y%m%dT%H%M%S") + f"{int(time.time() * 1000) % 1000:03d}"
+    base = os.path.join(PROFILING_DIR, f"{hash_execucao}-{carimbo}-{os.getpid()}")
+    inicio = time.perf_counter()
+
+    if modo == "deterministico":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield resultado
+        finally:
+            profiler.disable()
+            caminho = base + ".pstats"
+            profiler.dump_stats(caminho)
+
+            saida = io.StringIO()
+            stats = pstats.Stats(profiler, stream=saida)
+            stats.sort_stats("cumulative")
+            resultado["top"] = [
+                f"{os.path.basename(arquivo)}:{linha}({funcao}) {dados[3]:.4f}s"
+                for (arquivo, linha, funcao), dados in sorted(
+                    stats.stats.items(), key=lambda item: item[1][3], reverse=True
+                )[:TOP_FUNCOES]
+            ]
+            resultado["artefato"] = os.path.basename(caminho)
+    else:
+        amostrador = AmostradorPilhas(threading.get_ident())
+        amostrador.iniciar()
+        try:
+            yield resultado
+        finally:
+            amostrador.parar()
+            caminho = base + ".collapsed"
+            with open(caminho, "w") as f:
+                for pilha, contagem in amostrador.pilhas.most_common():
+                    f.write(f"{pilha} {contagem}\n")
+            resultado["top"] = amostrador.top()
+            resultado["amostras"] = sum(amostrador.pilhas.values())
+            resultado["artefato"] = os.path.basename(caminho)
+
+    resultado["duracao_s"] = round(time.perf_counter() - inicio, 3)
+    print(f"🔬 [Profiling] {resultado['modo']} → {resultado['artefato']} ({resultado['duracao_s']}s)")
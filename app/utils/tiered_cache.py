@@ -0,0 +1,395 @@
+# ==============================================================
+# 🧊 app/utils/tiered_cache.py
+# --------------------------------------------------------------
+# Cache em dois níveis para instâncias escaladas horizontalmente:
+#   - L1: LRU com TTL em memória do processo (sem rede)
+#   - L2: camada compartilhada com protocolo Redis (get/set/delete),
+#         comum a todas as instâncias — sobrevive a scale-out.
+# Inclui serialização binária de vetores float32, proteção contra
+# estouro de recomputação (lock local + SET NX no L2) e métricas
+# de acerto por nível. Sem CACHE_REDIS_URL, o L2 é desativado
+# (ou simulado em memória com CACHE_L2=memoria, para testes).
+# ==============================================================
+
+import os
+import json
+import time
+import zlib
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+
+try:
+    import redis  # em requirements.txt; a guarda só protege ambientes de desenvolvimento sem ele
+except ImportError:
+    redis = None
+
+# ==============================================================
+# ⚙️ Configuração
+# ==============================================================
+
+REDIS_URL = os.getenv("CACHE_REDIS_URL")
+L2_MODO = os.getenv("CACHE_L2", "redis" if REDIS_URL else "desativado")  # redis | memoria | desativado
+L1_CAPACIDADE = int(os.getenv("CACHE_L1_CAPACIDADE", "2000"))
+PREFIXO_CHAVES = os.getenv("CACHE_PREFIXO", "assistente-logs")
+TEMPO_LOCK_SEGUNDOS = 10       # validade do lock de recomputação no L2
+ESPERA_MAXIMA_SEGUNDOS = 2.0   # espera pelo valor calculado por outra instância
+INTERVALO_ESPERA = 0.05
+
+
+# ==============================================================
+# 🔧 Serialização
+# ==============================================================
+
+_VETOR = b"V"
+_JSON = b"J"
+
+
+def _json_padrao(valor):
+    if isinstance(valor, datetime):
+        return {"$dt": valor.isoformat()}
+    raise TypeError(f"Tipo não serializável no cache: {type(valor).__name__}")
+
+
+def _json_objeto(dados: dict):
+    if len(dados) == 1 and "$dt" in dados:
+        return datetime.fromisoformat(dados["$dt"])
+    return dados
+
+
+def _eh_vetor(valor) -> bool:
+    return isinstance(valor, np.ndarray) or (
+        isinstance(valor, list) and bool(valor) and all(isinstance(v, float) for v in valor[:8])
+    )
+
+
+def compactar(valor):
+    """
+    Vetores → ndarray float32 (≈6 KB para 1536 dimensões, contra ≈50 KB
+    numa lista de floats Python); demais valores são mantidos.
+    """
+    if _eh_vetor(valor):
+        return np.asarray(valor, dtype=np.float32)
+    return valor
+
+
+def serializar(valor) -> bytes:
+    """
+    Vetores (lista de floats ou ndarray) → float32 binário (4 bytes por dimensão);
+    demais valores → JSON (datetimes preservados).
+    """
+    if _eh_vetor(valor):
+        dados = np.asarray(valor, dtype=np.float32)
+        return _VETOR + struct.pack("<I", len(dados)) + dados.tobytes()
+    return _JSON + zlib.compress(json.dumps(valor, default=_json_padrao, ensure_ascii=False).encode())
+
+
+def desserializar(dados: bytes):
+    if dados[:1] == _VETOR:
+        (dimensoes,) = struct.unpack("<I", dados[1:5])
+        if len(dados) != 5 + 4 * dimensoes:
+            raise ValueError("Vetor truncado no cache")
+        return np.frombuffer(dados[5:5 + 4 * dimensoes], dtype=np.float32)
+    if dados[:1] == _JSON:
+        return json.loads(zlib.decompress(dados[1:]), object_hook=_json_objeto)
+    raise ValueError("Formato de cache desconhecido")
+
+
+# ==============================================================
+# 🗃️ L1: LRU com TTL
+# ==============================================================
+
+class LRUComTTL:
+    """Mapa limitado em memória; expira por TTL e remove o menos usado quando cheio."""
+
+    def __init__(self, capacidade: int = L1_CAPACIDADE):
+        self.capacidade = capacidade
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave: str):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def definir(self, chave: str, valor, ttl: float):
+        with self._lock:
+            self._itens[chave] = (valor, time.monotonic() + ttl)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+
+# ==============================================================
+# 🌐 L2: camada compartilhada (protocolo Redis)
+# ==============================================================
+
+class MemoriaL2:
+    """
+    L2 em memória com a mesma interface do cliente Redis (get/set/delete),
+    usado em testes e em desenvolvimento local.
+    """
+
+    def __init__(self):
+        self._itens = {}
+        self._lock = threading.Lock()
+
+    def get(self, chave: str):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if expira_em is not None and expira_em < time.monotonic():
+                del self._itens[chave]
+                return None
+            return valor
+
+    def set(self, chave: str, valor: bytes, ex: float = None, nx: bool = False):
+        with self._lock:
+            item = self._itens.get(chave)
+            if nx and item is not None and (item[1] is None or item[1] >= time.monotonic()):
+                return None
+            self._itens[chave] = (valor, time.monotonic() + ex if ex else None)
+            return True
+
+    def delete(self, chave: str):
+        with self._lock:
+            return 1 if self._itens.pop(chave, None) is not None else 0
+
+
+def criar_l2():
+    """Cria o L2 conforme a configuração (ou None se desativado/indisponível)."""
+    if L2_MODO == "memoria":
+        return MemoriaL2()
+    if L2_MODO == "redis":
+        if redis is None:
+            print("⚠️ [Cache] CACHE_REDIS_URL definido, mas o pacote `redis` não está instalado; L2 desativado.")
+            return None
+        try:
+            cliente = redis.Redis.from_url(REDIS_URL, socket_timeout=0.2, socket_connect_timeout=0.5)
+            print("✅ [Cache] L2 Redis configurado.")
+            return cliente
+        except Exception as e:
+            print(f"⚠️ [Cache] Falha ao configurar o L2 Redis: {e}")
+    return None
+
+
+# ==============================================================
+# 🧊 Cache em dois níveis
+# ==============================================================
+
+class TieredCache:
+    """
+    Cache L1 (processo) + L2 (compartilhado) para um namespace.
+    Vetores são guardados e devolvidos como ndarray float32.
+    Falhas do L2 nunca interrompem a requisição: o valor é calculado
+    normalmente e o erro é contado nas métricas.
+    """
+
+    def __init__(self, namespace: str, ttl: float, l2=None, capacidade_l1: int = L1_CAPACIDADE):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.l1 = LRUComTTL(capacidade_l1)
+        self.l2 = l2
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._contadores = dict.fromkeys(
+            ["l1_acertos", "l1_falhas", "l2_acertos", "l2_falhas", "l2_erros", "calculos", "esperas"], 0
+        )
+
+    def _chave(self, chave: str) -> str:
+        return f"{PREFIXO_CHAVES}:{self.namespace}:{hashlib.sha256(chave.encode()).hexdigest()[:32]}"
+
+    def _contar(self, nome: str):
+        self._contadores[nome] += 1
+
+    @contextmanager
+    def _travar(self, chave_l2: str):
+        """Lock por chave (descartado quando não há mais threads aguardando)."""
+        with self._locks_lock:
+            item = self._locks.setdefault(chave_l2, [threading.Lock(), 0])
+            item[1] += 1
+        try:
+            with item[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                item[1] -= 1
+                if not item[1]:
+                    del self._locks[chave_l2]
+
+    # ----------------------------------------------------------
+    # 📥 Leitura e escrita
+    # ----------------------------------------------------------
+    def _ler_l2(self, chave_l2: str, contar: bool = True):
+        if self.l2 is None:
+            return None
+        try:
+            dados = self.l2.get(chave_l2)
+        except Exception as e:
+            self._contar("l2_erros")
+            print(f"⚠️ [Cache] Erro de leitura no L2 ({self.namespace}): {e}")
+            return None
+        if dados is None:
+            if contar:
+                self._contar("l2_falhas")
+            return None
+        try:
+            valor = desserializar(dados)
+        except Exception as e:
+            # Entrada corrompida ou de formato desconhecido: tratada como ausente
+            self._contar("l2_erros")
+            print(f"⚠️ [Cache] Valor inválido no L2 ({self.namespace}): {e}")
+            return None
+        self._contar("l2_acertos")
+        return valor
+
+    def obter(self, chave: str):
+        """Valor do L1 ou, na falta, do L2 (promovido ao L1). None se ausente."""
+        chave_l2 = self._chave(chave)
+        valor = self.l1.obter(chave_l2)
+        if valor is not None:
+            self._contar("l1_acertos")
+            return valor
+        self._contar("l1_falhas")
+
+        valor = self._ler_l2(chave_l2)
+        if valor is not None:
+            self.l1.definir(chave_l2, valor, self.ttl)
+        return valor
+
+    def definir(self, chave: str, valor, ttl: float = None):
+        ttl = ttl or self.ttl
+        valor = compactar(valor)
+        chave_l2 = self._chave(chave)
+        self.l1.definir(chave_l2, valor, ttl)
+        if self.l2 is not None:
+            try:
+                self.l2.set(chave_l2, serializar(valor), ex=int(max(ttl, 1)))
+            except Exception as e:
+                self._contar("l2_erros")
+                print(f"⚠️ [Cache] Erro de escrita no L2 ({self.namespace}): {e}")
+
+    # ----------------------------------------------------------
+    # 🛡️ Leitura com cálculo protegido contra estouro
+    # ----------------------------------------------------------
+    def obter_ou_calcular(self, chave: str, calcular, ttl: float = None,
+                          espera_maxima: float = ESPERA_MAXIMA_SEGUNDOS):
+        """
+        Retorna o valor em cache ou o calcula uma única vez:
+        - no processo, um lock por chave serializa as threads concorrentes;
+        - entre instâncias, um lock SET NX no L2 elege quem calcula e as
+          demais aguardam o valor por até `espera_maxima` segundos.
+        Resultados vazios (falhas) não são armazenados.
+        """
+        valor = self.obter(chave)
+        if valor is not None:
+            return valor
+
+        chave_l2 = self._chave(chave)
+        with self._travar(chave_l2):
+            valor = self.l1.obter(chave_l2)
+            if valor is not None:
+                return valor
+
+            chave_lock = chave_l2 + ":lock"
+            possui_lock = True
+            if self.l2 is not None:
+                try:
+                    possui_lock = bool(self.l2.set(chave_lock, b"1", ex=TEMPO_LOCK_SEGUNDOS, nx=True))
+                except Exception:
+                    self._contar("l2_erros")
+
+            if not possui_lock:
+                # Outra instância está calculando: aguarda o valor no L2
+                self._contar("esperas")
+                limite = time.monotonic() + espera_maxima
+                while time.monotonic() < limite:
+                    time.sleep(INTERVALO_ESPERA)
+                    valor = self._ler_l2(chave_l2, contar=False)
+                    if valor is not None:
+                        self.l1.definir(chave_l2, valor, ttl or self.ttl)
+                        return valor
+
+            try:
+                self._contar("calculos")
+                valor = compactar(calcular())
+                if valor is not None and len(valor) > 0:
+                    self.definir(chave, valor, ttl)
+                return valor
+            finally:
+                if possui_lock and self.l2 is not None:
+                    try:
+                        self.l2.delete(chave_lock)
+                    except Exception:
+                        self._contar("l2_erros")
+
+    # ----------------------------------------------------------
+    # 📊 Métricas
+    # ----------------------------------------------------------
+    def metricas(self) -> dict:
+        c = dict(self._contadores)
+        l1_total = c["l1_acertos"] + c["l1_falhas"]
+        l2_total = c["l2_acertos"] + c["l2_falhas"]
+        return {
+            "l1": {"acertos": c["l1_acertos"], "falhas": c["l1_falhas"], "itens": len(self.l1),
+                   "taxa_acerto": round(c["l1_acertos"] / l1_total, 3) if l1_total else None},
+            "l2": {"ativo": self.l2 is not None, "acertos": c["l2_acertos"], "falhas": c["l2_falhas"],
+                   "erros": c["l2_erros"],
+                   "taxa_acerto": round(c["l2_acertos"] / l2_total, 3) if l2_total else None},
+            "calculos": c["calculos"],
+            "esperas_outra_instancia": c["esperas"],
+        }
+
+
+# ==============================================================
+# 🧠 Instâncias compartilhadas (uma por namespace)
+# ==============================================================
+
+_caches = {}
+_caches_lock = threading.Lock()
+_l2 = None
+_l2_criado = False
+
+
+def _l2_compartilhado():
+    global _l2, _l2_criado
+    if not _l2_criado:
+        _l2 = criar_l2()
+        _l2_criado = True
+    return _l2
+
+
+def obter_l2():
+    """Cliente L2 compartilhado do processo (ou None se desativado)."""
+    with _caches_lock:
+        return _l2_compartilhado()
+
+
+def obter_cache(namespace: str, ttl: float) -> TieredCache:
+    """Cache compartilhado do processo para o namespace (todos usam o mesmo L2)."""
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = TieredCache(namespace, ttl, l2=_l2_compartilhado())
+            _caches[namespace] = cache
+        return cache
+
+
+def metricas_caches() -> dict:
+    return {nome: cache.metricas() for nome, cache in _caches.items()}
@@ -1,5 +1,9 @@
-def is_prompt_valid(pergunta: str) -> bool:
-    """Retorna True se a pergunta estiver dentro do contexto técnico."""
+def is_prompt_valid(pergunta: str, acompanhamento: bool = False) -> bool:
+    """
+    Retorna True se a pergunta estiver dentro do contexto técnico.
+    Perguntas de acompanhamento de uma sessão ativa herdam o tema da
+    sessão: dispensam os termos técnicos, mas não a blacklist.
+    """
     if not pergunta or not pergunta.strip():
         return False
 
@@ -27,4 +31,7 @@ def is_prompt_valid(pergunta: str) -> bool:
     if any(word in pergunta_lower for word in blacklist):
         return False
 
+    if acompanhamento:
+        return True
+
     return any(word in pergunta_lower for word in temas_validos)
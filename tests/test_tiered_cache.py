@@ -0,0 +1,220 @@
+# ==============================================================
+# 🧪 tests/test_tiered_cache.py
+# --------------------------------------------------------------
+# Cache em dois níveis com o L2 em memória (MemoriaL2):
+# serialização, expiração por TTL, proteção contra estouro
+# de recomputação e leituras inválidas no L2.
+# ==============================================================
+
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from app.utils import tiered_cache
+from app.utils.tiered_cache import MemoriaL2, TieredCache, desserializar, serializar
+
+
+class Relogio:
+    """Relógio controlado pelo teste (substitui o módulo `time` do cache)."""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def monotonic(self):
+        return self.agora
+
+    def sleep(self, segundos):
+        self.agora += segundos
+
+    def avancar(self, segundos):
+        self.agora += segundos
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(tiered_cache, "time", relogio)
+    return relogio
+
+
+# ==============================================================
+# 🔧 Serialização
+# ==============================================================
+
+def test_vetor_ida_e_volta_em_float32():
+    vetor = [0.1, -0.25, 3.5, 0.0]
+    dados = serializar(vetor)
+
+    assert len(dados) == 5 + 4 * len(vetor)
+    lido = desserializar(dados)
+    assert lido.dtype == np.float32
+    np.testing.assert_allclose(lido, vetor, rtol=1e-6)
+
+
+def test_json_preserva_datetimes():
+    instante = datetime(2026, 10, 19, 12, 30, tzinfo=timezone.utc)
+    valor = {"candidatos": [{"doc_id": "a", "score": 0.5}], "ultimo_timestamp": instante}
+
+    assert desserializar(serializar(valor)) == valor
+
+
+def test_vetor_truncado_e_rejeitado():
+    with pytest.raises(ValueError):
+        desserializar(serializar([0.5] * 8)[:-4])
+
+
+# ==============================================================
+# 🌐 Ida e volta entre instâncias
+# ==============================================================
+
+def test_valor_gravado_por_uma_instancia_e_lido_por_outra():
+    l2 = MemoriaL2()
+    instancia_a = TieredCache("embeddings", ttl=60, l2=l2)
+    instancia_b = TieredCache("embeddings", ttl=60, l2=l2)
+
+    instancia_a.definir("texto", [0.5] * 16)
+    lido = instancia_b.obter("texto")
+
+    assert isinstance(lido, np.ndarray)
+    np.testing.assert_allclose(lido, [0.5] * 16)
+    assert instancia_b.metricas()["l2"]["acertos"] == 1
+
+    # Promovido ao L1: a segunda leitura não vai ao L2
+    instancia_b.obter("texto")
+    assert instancia_b.metricas()["l1"]["acertos"] == 1
+
+
+def test_l1_guarda_vetores_como_float32():
+    cache = TieredCache("embeddings", ttl=60)
+    cache.definir("texto", [0.25] * 1536)
+
+    valor = cache.obter("texto")
+    assert isinstance(valor, np.ndarray) and valor.dtype == np.float32
+    assert valor.nbytes == 4 * 1536
+
+
+# ==============================================================
+# ⏱️ TTL
+# ==============================================================
+
+def test_memoria_l2_expira_por_ttl(relogio):
+    l2 = MemoriaL2()
+    l2.set("chave", b"valor", ex=10)
+
+    relogio.avancar(9)
+    assert l2.get("chave") == b"valor"
+    relogio.avancar(2)
+    assert l2.get("chave") is None
+
+
+def test_set_nx_respeita_lock_vigente_e_expirado(relogio):
+    l2 = MemoriaL2()
+    assert l2.set("lock", b"1", ex=5, nx=True)
+    assert l2.set("lock", b"1", ex=5, nx=True) is None
+
+    relogio.avancar(6)
+    assert l2.set("lock", b"1", ex=5, nx=True)
+
+
+def test_cache_expira_nos_dois_niveis(relogio):
+    cache = TieredCache("contextos", ttl=30, l2=MemoriaL2())
+    cache.definir("pergunta", {"candidatos": []})
+
+    relogio.avancar(29)
+    assert cache.obter("pergunta") == {"candidatos": []}
+    relogio.avancar(2)
+    assert cache.obter("pergunta") is None
+
+
+# ==============================================================
+# 🛡️ Estouro de recomputação
+# ==============================================================
+
+def test_threads_concorrentes_calculam_uma_unica_vez():
+    cache = TieredCache("embeddings", ttl=60, l2=MemoriaL2())
+    calculos = []
+    inicio = threading.Barrier(8)
+
+    def calcular():
+        calculos.append(1)
+        time.sleep(0.05)
+        return [1.0, 2.0, 3.0]
+
+    def requisicao(resultados):
+        inicio.wait()
+        resultados.append(cache.obter_ou_calcular("mesmo texto", calcular))
+
+    resultados = []
+    threads = [threading.Thread(target=requisicao, args=(resultados,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calculos) == 1
+    assert len(resultados) == 8
+    for valor in resultados:
+        np.testing.assert_allclose(valor, [1.0, 2.0, 3.0])
+
+
+def test_outra_instancia_aguarda_o_valor_em_calculo():
+    l2 = MemoriaL2()
+    calculando = TieredCache("embeddings", ttl=60, l2=l2)
+    aguardando = TieredCache("embeddings", ttl=60, l2=l2)
+
+    # A primeira instância detém o lock de recomputação no L2
+    chave_l2 = calculando._chave("texto")
+    assert l2.set(chave_l2 + ":lock", b"1", ex=10, nx=True)
+    threading.Timer(0.1, lambda: calculando.definir("texto", [4.0, 5.0])).start()
+
+    valor = aguardando.obter_ou_calcular("texto", lambda: pytest.fail("não deveria recalcular"))
+
+    np.testing.assert_allclose(valor, [4.0, 5.0])
+    assert aguardando.metricas()["esperas_outra_instancia"] == 1
+    assert aguardando.metricas()["calculos"] == 0
+
+
+def test_resultado_vazio_nao_e_armazenado():
+    cache = TieredCache("embeddings", ttl=60, l2=MemoriaL2())
+
+    assert cache.obter_ou_calcular("texto", lambda: []) == []
+    assert cache.obter("texto") is None
+
+
+# ==============================================================
+# ⚠️ Falhas do L2
+# ==============================================================
+
+def test_valor_corrompido_no_l2_conta_como_erro_e_falta():
+    l2 = MemoriaL2()
+    cache = TieredCache("embeddings", ttl=60, l2=l2)
+    l2.set(cache._chave("texto"), b"Xlixo")
+
+    assert cache.obter("texto") is None
+    assert cache.metricas()["l2"]["erros"] == 1
+    assert cache.metricas()["l2"]["acertos"] == 0
+
+    # E o valor é recalculado normalmente
+    np.testing.assert_allclose(cache.obter_ou_calcular("texto", lambda: [0.5, 0.5]), [0.5, 0.5])
+
+
+def test_l2_indisponivel_nao_interrompe_a_leitura():
+    class L2Fora:
+        def get(self, chave):
+            raise ConnectionError("sem conexão")
+
+        def set(self, chave, valor, ex=None, nx=False):
+            raise ConnectionError("sem conexão")
+
+        def delete(self, chave):
+            raise ConnectionError("sem conexão")
+
+    cache = TieredCache("embeddings", ttl=60, l2=L2Fora())
+
+    valor = cache.obter_ou_calcular("texto", lambda: [1.0, 1.0])
+
+    np.testing.assert_allclose(valor, [1.0, 1.0])
+    assert cache.metricas()["l2"]["erros"] >= 2